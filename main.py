@@ -10,13 +10,22 @@ __email__ = "jh.ewers@gmail.com"
 __status__ = "prototype"
 
 import functools
-import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from src.shared_memory_helper import SharedArray
 from src.json_helpers import GlobalJsonDecoder, GlobalJsonEncoder
 from src.simulation.simulation import SimRunnerOutput
-from src.waypoint_generation.waypoint_settings import SarGenOutput, WpGenOutput
+from src.simulation.vehicle import VehicleSimData
+from src.waypoint_generation.waypoint_settings import SarGenOutput, WpGenOutput, WaypointAlgSettings
 from src.data_models.positional.waypoint import Waypoint, Waypoints
 
 import src.simulation.simulation as sim
+from src.simulation.monte_carlo import run_monte_carlo
+from src.simulation.multi_radius import run_multi_radius
+from src.simulation.success import probability_of_success
+from src.simulation.lockstep import LockstepSimulation
+from src.simulation.cooperative import CooperativeSimulation
+from src.simulation.sharded import run_sharded
 from src.simulation.parameters import *
 
 import json
@@ -33,7 +42,7 @@ import matplotlib.pyplot as plt
 
 from src.data_models.probability_map import ProbabilityMap
 from src.waypoint_generation import WaypointFactory
-from src.enums import WaypointAlgorithmEnum, PABOSolverEnum
+from src.enums import WaypointAlgorithmEnum, PABOSolverEnum, DetectionModeEnum, IntegratorEnum
 
 header_main = """
 ===============================================================
@@ -221,8 +230,93 @@ def setup_sim_parser(parser) -> None:
     group.add_argument('-F', '--fmincon', action='store_true')
 
     parser.add_argument('--flight_speed',help="Mean flight speed of the point mass (m/s)",default=1.0,type=float)
+    parser.add_argument('--dt',help="Integration time step (s)",default=dt,type=float)
+    choices = [str(f).split('.')[1].lower() for f in DetectionModeEnum]
+    parser.add_argument('--detection',
+                        help="Object detection mode. 'sampled' checks the vehicle position at every time step, 'swept' solves exact entry times along the flown path (allows a coarse --dt)",
+                        choices=choices, default=choices[0])
+    choices = [str(f).split('.')[1].lower() for f in IntegratorEnum]
+    parser.add_argument('--integrator',
+                        help="Vehicle integrator. 'vectorized' integrates whole batches of steps with cumulative sums",
+                        choices=choices, default=choices[0])
     
+    parser.add_argument('--coverage',
+                        help="Paint the time of first coverage of every probability map cell and detect objects by looking up their cell. The raster is saved in the output",
+                        action='store_true')
+
+    # Each of these runs a different experiment, only one of them can be asked for
+    mode = parser.add_argument_group('MODE').add_mutually_exclusive_group()
+    mode.add_argument(
+        "-T", "--threaded", action="store_true", help="Thread calculations where possible")
+    mode.add_argument(
+        "-A", "--animate", action="store_true", help="Animate calculations where possible")
+    mode.add_argument(
+        "--lockstep", action="store_true", help="Fly all paths together in one vectorized loop (always uses the scalar integrator arithmetic)")
+    mode.add_argument(
+        "--cooperative", action="store_true", help="Fly all paths at once as a team of vehicles, crediting every object to the first vehicle that detects it")
+    mode.add_argument(
+        "--shard_detection", action="store_true", help="Fly every path once and split the object detection over a pool of --workers processes (runs in process below 50000 object cells per worker, where the pool costs more than it saves)")
+    mode.add_argument('--radii',
+                      help="Evaluate all of these search radii in a single pass instead of -S",
+                      nargs='+',
+                      type=float,
+                      default=None,
+                      metavar='R')
+    mode.add_argument('--success_curve',
+                      help="Integrate the probability map over the time every cell is first covered instead of simulating placed objects (no --object_location needed)",
+                      action='store_true')
+    mode.add_argument('--monte_carlo',
+                      dest='monte_carlo',
+                      metavar='K',
+                      type=int,
+                      default=None,
+                      help="Fly every path once and evaluate K object sets drawn from the probability map instead of --object_location (see MONTE CARLO)")
+
+    stop = parser.add_argument_group('STOP CONDITIONS')
+    stop.add_argument('--max_time',
+                      help="Stop flying after this many seconds",
+                      type=float,
+                      default=None)
+    stop.add_argument('--endurance',
+                      help="Stop flying after this distance (m). Without a value the unit_endurance from global.settings is used",
+                      type=float,
+                      nargs='?',
+                      const=WaypointAlgSettings.Global().unit_endurance,
+                      default=None)
+    stop.add_argument('--target_found_fraction',
+                      help="Stop flying once this fraction of the objects is found. Without a value the run stops once all objects are found",
+                      type=float,
+                      nargs='?',
+                      const=1.0,
+                      default=None,
+                      metavar='FRACTION')
+
+    monte_carlo = parser.add_argument_group('MONTE CARLO')
+    monte_carlo.add_argument('-n',
+                             help="The amount of persons placed on the map per Monte Carlo set",
+                             type=int,
+                             default=10,
+                             dest="num_persons")
+    monte_carlo.add_argument('--seed',
+                             help="Seed of the Monte Carlo object placements",
+                             type=int,
+                             default=None)
+
     operational = parser.add_argument_group('OPERATIONAL')
+    operational.add_argument("--workers",
+                             type=int,
+                             default=None,
+                             help="Maximum number of worker processes used with --threaded and --shard_detection (defaults to the cpu count)")
+    operational.add_argument("--trajectory_cache",
+                             default=None,
+                             metavar='DIRECTORY',
+                             help="Cache flown trajectories in this directory and replay them when the path, flight speed, dt and integrator match",
+                             type=lambda x: is_valid_file(parser, x))
+    operational.add_argument("--ledger_dir",
+                             default=None,
+                             metavar='DIRECTORY',
+                             help="Spill the per-object detection times to memory mapped files in this directory instead of keeping them in memory",
+                             type=lambda x: is_valid_file(parser, x))
     operational.add_argument("-O", "--out_file",
                              default="output_sim.json",
                              dest="out_file",
@@ -230,11 +324,6 @@ def setup_sim_parser(parser) -> None:
                              help="Output file name in json format",
                              type=lambda x: is_valid_path_for_file(parser, x)
                              )
-    group = operational.add_mutually_exclusive_group()
-    group.add_argument(
-        "-T", "--threaded", action="store_true", help="Thread calculations where possible")
-    group.add_argument(
-        "-A", "--animate", action="store_true", help="Animate calculations where possible")
     
 def do_wp_gen(args):
     #   ==================
@@ -324,7 +413,7 @@ def do_wp_gen(args):
     with open(args.out_file, 'w') as f:
         json.dump(wp_gen_output,f,cls=GlobalJsonEncoder)
 
-def do_sar(args):
+def load_sar_prob_map(args) -> ProbabilityMap:
     prob_map = ProbabilityMap.fromPNG(args.filename)
     logger.trace(f"ProbabilityMap({args.filename})")
     if args.dimmensions is not None:
@@ -333,14 +422,16 @@ def do_sar(args):
         prob_map = prob_map.resampled(int(width_m),int(height_m))
     elif args.shape is not None:
         prob_map = prob_map.resampled(*args.shape)
+    return prob_map
 
+def do_sar(args):
+    prob_map = load_sar_prob_map(args)
 
     logger.info(
         f"Generating {args.num_persons} possible positions within the {prob_map.shape} area")
 
     sar_gen_output = SarGenOutput()
-    points = prob_map.place(args.num_persons)
-    sar_gen_output.add_generated_locations(points)
+    sar_gen_output.add_generated_cells(*prob_map.place_counts(args.num_persons))
 
     outfile = sys.stdout
     if args.out_file is not None:
@@ -357,7 +448,7 @@ def do_sar(args):
             np.arange(0, prob_map.shape[0]), np.arange(0, prob_map.shape[1]))
         x, y = x.flatten(), y.flatten()
 
-        points = points.toNumpyArray()
+        points = sar_gen_output.cells
 
         img = prob_map.toIMG()
         plt.imshow(img, 
@@ -369,51 +460,102 @@ def do_sar(args):
         plt.ylabel("Y (m)")
         plt.show()
 
-def threaded_sim(placed_objs,r,v, out_dic,alg,wps):
-    out_dic[alg] = sim.Simulation(wps, placed_objs, r, v, False,alg=alg).run()
+def ledger_path(args, alg) -> str:
+    if args.ledger_dir is None:
+        return None
+    return os.path.join(args.ledger_dir, f"ledger_{alg.split('.')[1].lower()}_{os.getpid()}.npy")
+
+def pooled_sim(cells_spec,counts_spec,r,v,alg,wps,sim_kwargs):
+    """Run one simulation in a pool worker against the shared object cells and counts.
+
+    Returns plain arrays instead of a VehicleSimData so the result pickles cheaply.
+    """
+    with SharedArray.attach(cells_spec) as cells, SharedArray.attach(counts_spec) as counts:
+        data = sim.Simulation(wps, cells.array, r, v, False,alg=alg,object_counts=counts.array,**sim_kwargs).run()
+    found_t = np.array([f[0] for f in data.found])
+    found_xy = np.array([f[1] for f in data.found]).reshape(-1,2)
+    return alg, data.t, data.pos.toNumpyArray(), data.dpos.toNumpyArray(), data.ddpos.toNumpyArray(), found_t, found_xy, data.coverage, data.stop_reason
 
 def do_sim(args):
 
     wp_gen_output = WpGenOutput([]).add_generated_wps(Waypoints(args.WPS),-1,WaypointAlgorithmEnum.UNKNOWN) if not isinstance(args.WPS[0],WpGenOutput) else args.WPS[0]
-    
-    if isinstance(args.object_location[0],SarGenOutput):
-        placed_objs = Waypoints(args.object_location[0].data)
-    else:
-        placed_objs = Waypoints(args.object_location)
-    assert(all([isinstance(f, Waypoint) for f in placed_objs]))
+
+    sim_kwargs = {'detection':DetectionModeEnum[args.detection.upper()], 'dt':args.dt, 'integrator':IntegratorEnum[args.integrator.upper()], 'trajectory_cache':args.trajectory_cache,
+                  'max_time':args.max_time, 'endurance':args.endurance, 'target_found_fraction':args.target_found_fraction}
+    if args.coverage:
+        sim_kwargs['coverage_shape'] = load_sar_prob_map(args).shape
 
     sim_runner_output = SimRunnerOutput()
 
+    if args.success_curve:
+        prob_map = load_sar_prob_map(args)
+        for wp_alg,data in wp_gen_output.data.items():
+            logger.info(f"Probability of success of {wp_alg}")
+            simulation = sim.Simulation(data['wps'],None,args.search_radius,args.flight_speed,alg=wp_alg,**sim_kwargs)
+            sim_runner_output.add_success_data(probability_of_success(simulation, prob_map),WaypointAlgorithmEnum[wp_alg.split('.')[1]])
+
+        with open(args.out_file,'w') as f:
+            json.dump(sim_runner_output,f,cls=GlobalJsonEncoder)
+        return
+
+    if args.monte_carlo is not None:
+        prob_map = load_sar_prob_map(args)
+        for wp_alg,data in wp_gen_output.data.items():
+            logger.info(f"Monte Carlo simulation of {wp_alg} with {args.monte_carlo} sets")
+            simulation = sim.Simulation(data['wps'],None,args.search_radius,args.flight_speed,alg=wp_alg,**sim_kwargs)
+            mc_output = run_monte_carlo(simulation, prob_map, args.monte_carlo, args.num_persons, args.seed)
+            sim_runner_output.add_monte_carlo_data(mc_output,WaypointAlgorithmEnum[wp_alg.split('.')[1]])
+
+        with open(args.out_file,'w') as f:
+            json.dump(sim_runner_output,f,cls=GlobalJsonEncoder)
+        return
+
+    if isinstance(args.object_location[0],SarGenOutput):
+        placed_objs = args.object_location[0]
+    else:
+        assert(all([isinstance(f, Waypoint) for f in args.object_location]))
+        placed_objs = SarGenOutput()
+        placed_objs.add_generated_locations(Waypoints(args.object_location))
+    cells, counts = placed_objs.cells, placed_objs.counts
+
     total_items = len(wp_gen_output.data)
     c = 0
 
-    if args.threaded:
-        logger.info(f"Simulating all algs with threading ({total_items} simulations to run)")
-        managers = multiprocessing.Manager()
-        out_dict = managers.dict()
-        # pool = multiprocessing.Pool(2)
-        # wps_iter = [(f,g['wps']) for f,g in wp_gen_output.data.items()]
-        # partial = functools.partial(threaded_sim,placed_objs,args.search_radius, args.flight_speed,out_dict)
-        # result = pool.map(func=partial, iterable=wps_iter)
-        # pool.close()
-        # pool.join()
-
-        jobs = []
+    if args.radii is not None:
         for wp_alg,data in wp_gen_output.data.items():
-            wps = data['wps']
-            p = multiprocessing.Process(target=threaded_sim, args=(placed_objs,args.search_radius, args.flight_speed,out_dict,wp_alg,wps))
-            jobs.append(p)
-            p.start()
-        for proc in jobs:
-            proc.join()
-        for key in out_dict:
-            sim_runner_output.add_simulation_data(out_dict[key],WaypointAlgorithmEnum[key.split('.')[1]])
+            logger.info(f"Multi radius simulation of {wp_alg}")
+            simulation = sim.Simulation(data['wps'],cells,max(args.radii),args.flight_speed,alg=wp_alg,object_counts=counts,**sim_kwargs)
+            sim_runner_output.add_multi_radius_data(run_multi_radius(simulation,args.radii),WaypointAlgorithmEnum[wp_alg.split('.')[1]])
+    elif args.threaded:
+        workers = min(args.workers or os.cpu_count(), total_items)
+        logger.info(f"Simulating all algs with a pool of {workers} workers ({total_items} simulations to run)")
+        with SharedArray.create(cells) as shared_cells, SharedArray.create(counts) as shared_counts, ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(pooled_sim, shared_cells.spec, shared_counts.spec, args.search_radius, args.flight_speed, wp_alg, data['wps'], {**sim_kwargs,'ledger_path':ledger_path(args,wp_alg)}) for wp_alg,data in wp_gen_output.data.items()]
+            for future in futures:
+                wp_alg, t, pos, dpos, ddpos, found_t, found_xy, coverage, stop_reason = future.result()
+                logger.trace(f"Iteration {(c:=c+1)} out of {total_items} ({100*c/total_items:.2f}%)")
+                vehicle_sim_data = VehicleSimData.fromArrays(t, pos, dpos, ddpos, found=zip(found_t.tolist(), found_xy))
+                vehicle_sim_data.coverage = coverage
+                vehicle_sim_data.stop_reason = stop_reason
+                sim_runner_output.add_simulation_data(vehicle_sim_data,WaypointAlgorithmEnum[wp_alg.split('.')[1]])
+    elif args.shard_detection:
+        for wp_alg,data in wp_gen_output.data.items():
+            logger.info(f"Simulating {wp_alg} with sharded detection")
+            logger.trace(f"Iteration {(c:=c+1)} out of {total_items} ({100*c/total_items:.2f}%)")
+            simulation = sim.Simulation(data['wps'],cells,args.search_radius,args.flight_speed,alg=wp_alg,ledger_path=ledger_path(args,wp_alg),object_counts=counts,**sim_kwargs)
+            sim_runner_output.add_simulation_data(run_sharded(simulation,args.workers),WaypointAlgorithmEnum[wp_alg.split('.')[1]])
+    elif args.lockstep or args.cooperative:
+        logger.info(f"Simulating all algs {'cooperatively' if args.cooperative else 'in lockstep'} ({total_items} simulations to run)")
+        algs = list(wp_gen_output.data.keys())
+        lockstep = (CooperativeSimulation if args.cooperative else LockstepSimulation)([f['wps'] for f in wp_gen_output.data.values()],cells,args.search_radius,args.flight_speed,algs=algs,detection=sim_kwargs['detection'],dt=sim_kwargs['dt'],object_counts=counts)
+        for wp_alg,vehicle_sim_data in zip(algs,lockstep.run()):
+            sim_runner_output.add_simulation_data(vehicle_sim_data,WaypointAlgorithmEnum[wp_alg.split('.')[1]])
     else:
         for wp_alg,data in wp_gen_output.data.items():
             wps = data['wps']
             logger.info(f"Simulating {wp_alg}")
             logger.trace(f"Iteration {(c:=c+1)} out of {total_items} ({100*c/total_items:.2f}%)")
-            vehicle_sim_data = sim.Simulation(wps,placed_objs,args.search_radius,args.flight_speed,args.animate).run()
+            vehicle_sim_data = sim.Simulation(wps,cells,args.search_radius,args.flight_speed,args.animate,alg=wp_alg,ledger_path=ledger_path(args,wp_alg),object_counts=counts,**sim_kwargs).run()
             sim_runner_output.add_simulation_data(vehicle_sim_data,WaypointAlgorithmEnum[wp_alg.split('.')[1]])
 
     with open(args.out_file,'w') as f:
@@ -524,6 +666,37 @@ if __name__ == "__main__":
 #   | CHECK ARGS (error on fail) |
 #   ==============================
 
+    if args.command in sim_aliases and (args.lockstep or args.cooperative):
+        # The lockstep loop has its own integration and ledgers, none of these options reach it
+        unsupported = {'--max_time':args.max_time is not None, '--endurance':args.endurance is not None,
+                       '--target_found_fraction':args.target_found_fraction is not None,
+                       '--integrator':IntegratorEnum[args.integrator.upper()] is not IntegratorEnum.SCALAR,
+                       '--trajectory_cache':args.trajectory_cache is not None, '--coverage':args.coverage,
+                       '--ledger_dir':args.ledger_dir is not None}
+        if any(unsupported.values()):
+            parser.error(f"{'--cooperative' if args.cooperative else '--lockstep'} does not support {', '.join(f for f, g in unsupported.items() if g)}")
+
+    if args.command in sim_aliases and args.radii is not None:
+        # The multi radius search keeps a ledger per radius over the whole flown path
+        unsupported = {'--target_found_fraction':args.target_found_fraction is not None, '--coverage':args.coverage,
+                       '--ledger_dir':args.ledger_dir is not None}
+        if any(unsupported.values()):
+            parser.error(f"--radii does not support {', '.join(f for f, g in unsupported.items() if g)}")
+
+    if args.command in sim_aliases and args.monte_carlo is not None:
+        # Every set is drawn from the probability map and searched over the whole flown path
+        unsupported = {'--object_location':args.object_location is not None, '--target_found_fraction':args.target_found_fraction is not None,
+                       '--ledger_dir':args.ledger_dir is not None}
+        if any(unsupported.values()):
+            parser.error(f"--monte_carlo does not support {', '.join(f for f, g in unsupported.items() if g)}")
+
+    if args.command in sim_aliases and args.success_curve:
+        # The curve integrates the probability map over the painted coverage, no objects are placed or searched
+        unsupported = {'--object_location':args.object_location is not None, '--target_found_fraction':args.target_found_fraction is not None,
+                       '--coverage':args.coverage, '--ledger_dir':args.ledger_dir is not None, '--seed':args.seed is not None}
+        if any(unsupported.values()):
+            parser.error(f"--success_curve does not support {', '.join(f for f, g in unsupported.items() if g)}")
+
 #   ================
 #   | LOGGER SETUP |
 #   ================
@@ -0,0 +1,12 @@
+import numpy as np
+from typing import Tuple
+
+def unique_counts(locations: np.ndarray, counts: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Collapse (N, 2) `locations` into their unique rows and the number of objects at each.
+
+    `counts` weighs every input row and defaults to one object per row.
+    """
+    locations = np.asarray(locations).reshape(-1, 2)
+    counts = np.ones(len(locations), dtype=int) if counts is None else np.asarray(counts, dtype=int).reshape(-1)
+    cells, inverse = np.unique(locations, axis=0, return_inverse=True)
+    return cells, np.bincount(inverse.reshape(-1), weights=counts, minlength=len(cells)).astype(int)
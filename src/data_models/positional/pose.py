@@ -1,4 +1,5 @@
 import json
+import numpy as np
 from src.data_models.positional.waypoint import Waypoint
 from src.data_models.abstractListObject import AbstractListObject
 from .abstractPositionDataObjects import AbstractPositionDataObject
@@ -44,4 +45,39 @@ class Poses(AbstractListObject):
         return f"Poses([{', '.join([str(f) for f in self.items])}])"
 
     def __repr__(self) -> str:
-        return self.__str__()
\ No newline at end of file
+        return self.__str__()
+
+class PoseArray:
+    """Read-only view of an (N, 2) array of poses with the `Poses` accessors.
+
+    `x` and `y` are views into the underlying array, nothing is copied.
+    """
+    def __init__(self, array: np.ndarray) -> None:
+        self.array = array
+
+    @property
+    def x(self) -> np.ndarray:
+        return self.array[:,0]
+    @property
+    def y(self) -> np.ndarray:
+        return self.array[:,1]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return PoseArray(self.array[key])
+        return Pose(self.array[key])
+
+    def __iter__(self):
+        return (Pose(f) for f in self.array)
+
+    def __len__(self) -> int:
+        return len(self.array)
+
+    def toNumpyArray(self) -> np.ndarray:
+        return self.array
+
+    def __str__(self) -> str:
+        return f"PoseArray({self.array.tolist()})"
+
+    def __repr__(self) -> str:
+        return self.__str__()
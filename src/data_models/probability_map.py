@@ -47,14 +47,35 @@ class ProbabilityMap:
         img = Image.fromarray(self.prob_map).resize((x,y),Image.BOX)        
         return ProbabilityMap(np.array(img))
     
-    def place(self, n:int=1) -> Waypoints:               
+    def place(self, n:int=1, rng: np.random.Generator=None) -> Waypoints:               
+        return Waypoints(self.place_array(n, rng))
+
+    def place_array(self, n:int=1, rng: np.random.Generator=None) -> np.ndarray:
+        """Draw `n` (x, y) grid cells with the map as probability mass, as an (n, 2) int array.
+
+        Uses the global NumPy RNG unless a `numpy.random.Generator` is given.
+        """
         x,y = np.meshgrid(np.arange(0,self.shape[1]),np.arange(0,self.shape[0]))
         x,y = x.flatten(),y.flatten()
         xy  = np.vstack((x,y)).T
         xy_indices = np.arange(len(xy))
-        choices = np.random.choice(xy_indices, n, p=self.prob_map.flatten())
-        points = xy[choices]
-        return Waypoints(points)
+        choice = np.random.choice if rng is None else rng.choice
+        choices = choice(xy_indices, n, p=self.prob_map.flatten())
+        return xy[choices]
+
+    def place_counts(self, n:int=1, rng: np.random.Generator=None):
+        """Draw `n` objects like `place_array` but return the occupied (x, y) cells and their object counts.
+
+        The counts are a single multinomial draw over the map, so the cost scales with the map size
+        and not with `n`.
+        """
+        x,y = np.meshgrid(np.arange(0,self.shape[1]),np.arange(0,self.shape[0]))
+        xy  = np.vstack((x.flatten(),y.flatten())).T
+        multinomial = np.random.multinomial if rng is None else rng.multinomial
+        p = self.prob_map.flatten()
+        counts = multinomial(n, p/np.sum(p))
+        occupied = counts > 0
+        return xy[occupied], counts[occupied]
 
     def __getitem__(self, key):
         if isinstance(key, int):
@@ -69,6 +90,15 @@ class ProbabilityMap:
                 return -np.iinfo(np.int16).max
         raise KeyError(f"Type {type(key)} is not valid")
     
+    def lookup(self, xy: np.ndarray) -> np.ndarray:
+        """Vectorised `self[(x, y)]` for an (n, 2) array of positions, reading off the map as -32767 the same way."""
+        xy = np.reshape(xy, (-1,2))
+        i, j = xy[:,0].astype(int), xy[:,1].astype(int)
+        on_map = (j >= -self.shape[0]) & (j < self.shape[0]) & (i >= -self.shape[1]) & (i < self.shape[1])
+        ret = np.full(len(xy), float(-np.iinfo(np.int16).max))
+        ret[on_map] = self.prob_map[j[on_map],i[on_map]]
+        return ret
+
     def __setitem__(self, key, data):
         if isinstance(key, int):
             self.prob_map[key] = data
@@ -1,2 +1,7 @@
 from .pabo_solver_enum import PABOSolverEnum
-from .waypoint_algorithm_enum import WaypointAlgorithmEnum
\ No newline at end of file
+from .waypoint_algorithm_enum import WaypointAlgorithmEnum
+from .detection_mode_enum import DetectionModeEnum
+from .integrator_enum import IntegratorEnum
+from .stop_reason_enum import StopReasonEnum
+from .sim_event_enum import SimEventEnum
+from .l_search_enum import LSearchEnum
\ No newline at end of file
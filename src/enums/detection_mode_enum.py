@@ -0,0 +1,5 @@
+from enum import Enum, auto
+
+class DetectionModeEnum(Enum):
+    SAMPLED=auto()
+    SWEPT=auto()
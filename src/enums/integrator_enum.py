@@ -0,0 +1,5 @@
+from enum import Enum, auto
+
+class IntegratorEnum(Enum):
+    SCALAR=auto()
+    VECTORIZED=auto()
@@ -0,0 +1,6 @@
+from enum import Enum, auto
+
+class LSearchEnum(Enum):
+    EXHAUSTIVE=auto()
+    COARSE=auto()
+    GOLDEN=auto()
@@ -0,0 +1,6 @@
+from enum import Enum, auto
+
+class SimEventEnum(Enum):
+    DETECTION=auto()
+    SNAPSHOT=auto()
+    STOP=auto()
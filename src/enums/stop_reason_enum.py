@@ -0,0 +1,8 @@
+from enum import Enum, auto
+
+class StopReasonEnum(Enum):
+    COMPLETED=auto()
+    ALL_FOUND=auto()
+    FOUND_FRACTION=auto()
+    TIME_BUDGET=auto()
+    ENDURANCE=auto()
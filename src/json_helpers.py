@@ -1,21 +1,28 @@
 import json
 from src.enums.waypoint_algorithm_enum import WaypointAlgorithmEnum
+from src.enums.stop_reason_enum import StopReasonEnum
 from src.simulation.simulation import SimRunnerOutput
+from src.simulation.monte_carlo import MonteCarloResult
+from src.simulation.multi_radius import MultiRadiusResult
+from src.simulation.success import SuccessCurve
 import numpy as np
 from src.data_models.probability_map import ProbabilityMap
 from src.waypoint_generation.waypoint_settings import SarGenOutput, WpGenOutput
 from src.data_models.positional.waypoint import Waypoint, Waypoints
-from src.data_models.positional.pose import Pose, Poses
+from src.data_models.positional.pose import Pose, Poses, PoseArray
 from src.simulation.vehicle import VehicleSimData
 
 PUBLIC_ENUMS = {
-    'WaypointAlgorithmEnum':WaypointAlgorithmEnum
+    'WaypointAlgorithmEnum':WaypointAlgorithmEnum,
+    'StopReasonEnum':StopReasonEnum
 }
 
 class GlobalJsonEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, Poses):
             return {'__poses__':True,'x':obj.x,'y':obj.y}
+        elif isinstance(obj, PoseArray):
+            return {'__pose_array__':True,'x':obj.x,'y':obj.y}
         elif isinstance(obj,Waypoints):
             return {'__waypoints__':True,'x':obj.x,'y':obj.y}
         elif isinstance(obj,Waypoint):
@@ -23,13 +30,24 @@ class GlobalJsonEncoder(json.JSONEncoder):
         elif isinstance(obj,WpGenOutput):
             return {'__wp_gen_output__':True,'img':obj.img,'data':obj.data}
         elif isinstance(obj,SimRunnerOutput):
-            return {'__sim_runner_output__':True,'data':obj.data}
+            return {'__sim_runner_output__':True,'data':obj.data,'monte_carlo':obj.monte_carlo,'multi_radius':obj.multi_radius,'success':obj.success}
+        elif isinstance(obj,MonteCarloResult):
+            return {'__monte_carlo_result__':True,'found_fraction':obj.found_fraction,'detection_times':obj.detection_times,
+                    'n_objects':obj.n_objects,'seed':obj.seed,'vehicle_data':obj.vehicle_data}
+        elif isinstance(obj,MultiRadiusResult):
+            return {'__multi_radius_result__':True,'radii':obj.radii,'found_fraction':obj.found_fraction,'detection_times':obj.detection_times,
+                    'min_distance':np.where(np.isfinite(obj.min_distance),obj.min_distance,-1),'cells':obj.cells,'counts':obj.counts,'vehicle_data':obj.vehicle_data}
+        elif isinstance(obj,SuccessCurve):
+            return {'__success_curve__':True,'t':obj.t,'p':obj.p,'vehicle_data':obj.vehicle_data}
         elif isinstance(obj,SarGenOutput):
-            return {'__sar_gen_output__':True,'data':obj.data}
+            return {'__sar_gen_output__':True,'cells':obj.cells,'counts':obj.counts}
         elif isinstance(obj,ProbabilityMap):
             return {'__probability_map__':True,'prob_map':obj.prob_map.tolist()}
         elif isinstance(obj,VehicleSimData):
-            return {'__vehicle_sim_data__':True,'found':obj.found,'t':obj.t,'pos':obj.pos,'dpos':obj.dpos, 'ddpos':obj.ddpos}
+            dct = {'__vehicle_sim_data__':True,'found':obj.found,'t':obj.t,'pos':obj.pos,'dpos':obj.dpos, 'ddpos':obj.ddpos, 'stop_reason':obj.stop_reason}
+            if obj.coverage is not None:
+                dct['coverage'] = np.where(np.isnan(obj.coverage),-1,obj.coverage)
+            return dct
         elif isinstance(obj, np.integer):
             return int(obj)
         elif isinstance(obj, np.floating):
@@ -49,6 +67,8 @@ class GlobalJsonDecoder(json.JSONDecoder):
         if '__poses__' in dct:
             poses = [Pose(f,g) for f,g in zip(dct['x'],dct['y'])]
             ret = Poses(poses)
+        elif '__pose_array__' in dct:
+            ret = PoseArray(np.column_stack((dct['x'],dct['y'])).reshape(-1,2))
         elif '__waypoints__' in dct:
             ret = Waypoints([Waypoint(f,g) for f,g in zip(dct['x'],dct['y'])])
         elif '__waypoint__' in dct:
@@ -59,15 +79,32 @@ class GlobalJsonDecoder(json.JSONDecoder):
         elif '__sim_runner_output__' in dct:
             ret = SimRunnerOutput()
             ret.data = dct['data']
+            ret.monte_carlo = dct.get('monte_carlo',[])
+            ret.multi_radius = dct.get('multi_radius',[])
+            ret.success = dct.get('success',[])
+        elif '__monte_carlo_result__' in dct:
+            ret = MonteCarloResult(dct['found_fraction'], dct['detection_times'], dct['n_objects'], dct['seed'], dct['vehicle_data'])
+        elif '__multi_radius_result__' in dct:
+            min_distance = np.array(dct['min_distance'],dtype=float)
+            min_distance[min_distance < 0] = np.inf
+            ret = MultiRadiusResult(dct['radii'], dct['found_fraction'], dct['detection_times'], min_distance, dct['cells'], dct['counts'], dct['vehicle_data'])
+        elif '__success_curve__' in dct:
+            ret = SuccessCurve(dct['t'], dct['p'], dct['vehicle_data'])
         elif'__sar_gen_output__' in dct:
             ret = SarGenOutput()
-            ret.data = dct['data'] 
+            if 'cells' in dct:
+                ret.add_generated_cells(np.array(dct['cells'],dtype=float).reshape(-1,2), dct['counts'])
+            else:
+                ret.data = dct['data']
         elif '__probability_map__' in dct:
             ret = ProbabilityMap(dct['prob_map'])
         elif '__vehicle_sim_data__' in dct:
-            ret = VehicleSimData()
-            dct.pop('__vehicle_sim_data__')
-            ret.__dict__.update(dct)
+            as_array = lambda p: np.column_stack((p.x, p.y)).reshape(-1,2)
+            ret = VehicleSimData.fromArrays(dct['t'], as_array(dct['pos']), as_array(dct['dpos']), as_array(dct['ddpos']), dct['found'])
+            ret.stop_reason = dct.get('stop_reason')
+            if 'coverage' in dct:
+                ret.coverage = np.array(dct['coverage'],dtype=float)
+                ret.coverage[ret.coverage < 0] = np.nan
         if "__enum__" in dct:
             name, member = dct["__enum__"].split(".")
             return getattr(PUBLIC_ENUMS[name], member) 
@@ -0,0 +1,46 @@
+from multiprocessing import shared_memory
+import numpy as np
+from typing import Tuple
+
+class SharedArray:
+    """A numpy array backed by a `multiprocessing.shared_memory` block.
+
+    The creating process owns the block and must `unlink` it once every worker is done. Workers
+    receive the picklable `spec` and `attach` to the same memory without copying the data.
+    """
+    def __init__(self, shm: shared_memory.SharedMemory, shape: Tuple[int, ...], dtype, owner: bool) -> None:
+        self.shm = shm
+        self.owner = owner
+        self.array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+    @classmethod
+    def create(cls, array: np.ndarray) -> 'SharedArray':
+        array = np.ascontiguousarray(array)
+        shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        shared = cls(shm, array.shape, array.dtype, owner=True)
+        shared.array[...] = array
+        return shared
+
+    @classmethod
+    def attach(cls, spec: Tuple[str, Tuple[int, ...], str]) -> 'SharedArray':
+        name, shape, dtype = spec
+        return cls(shared_memory.SharedMemory(name=name), shape, dtype, owner=False)
+
+    @property
+    def spec(self) -> Tuple[str, Tuple[int, ...], str]:
+        return self.shm.name, self.array.shape, self.array.dtype.str
+
+    def close(self) -> None:
+        del self.array
+        self.shm.close()
+
+    def unlink(self) -> None:
+        self.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self) -> 'SharedArray':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.unlink() if self.owner else self.close()
@@ -0,0 +1,44 @@
+from loguru import logger
+import numpy as np
+from src.simulation.lockstep import LockstepSimulation
+from src.simulation.vehicle import VehicleSimData
+from src.simulation.spatial_index import GridIndex
+from src.simulation.detection import DetectionLedger
+from typing import List
+
+class CooperativeSimulation(LockstepSimulation):
+    """Several vehicles searching one shared set of objects together.
+
+    The vehicles are flown in lockstep and every chunk is searched for all of them in one pass
+    against the shared found mask. An object seen by several vehicles in the same chunk is credited
+    to the one that saw it first, ties going to the vehicle listed first.
+    """
+    def run(self) -> List[VehicleSimData]:
+        logger.info(f"Cooperative simulation of {len(self)} vehicles", enqueue=True)
+        objs_possible_xy = self.simulations[0]._candidates() if len(self) > 0 else np.zeros((0,2))
+
+        index = GridIndex(objs_possible_xy, max(self.search_radius, 1.0))
+        ledger = DetectionLedger(len(objs_possible_xy))
+        owner = np.full(len(objs_possible_xy), -1)
+
+        for t, xy in self._fly():
+            veh, inds, t_found = self.detect(index, t, xy, np.broadcast_to(ledger.found, (len(self), len(ledger))))
+            order = np.lexsort((veh, t_found))
+            _, first = np.unique(inds[order], return_index=True)
+            first = order[first]
+            ledger.record(inds[first], t_found[first])
+            owner[inds[first]] = veh[first]
+
+        if len(self) > 0:
+            counts, num_objs = self.simulations[0].object_counts, self.simulations[0].num_objs
+            found = int(np.sum(counts[ledger.found]))
+            logger.info(f"Cooperative simulation found {100*found/max(num_objs,1):.2f}% ({found}/{num_objs}) objects", enqueue=True)
+
+        # Split the shared ledger into the detections credited to every vehicle
+        data = []
+        for i, simulation in enumerate(self.simulations):
+            credited = DetectionLedger(len(ledger))
+            inds = np.where(owner == i)[0]
+            credited.record(inds, ledger.times[inds])
+            data.append(simulation._collect(credited, objs_possible_xy))
+        return data
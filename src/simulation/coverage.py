@@ -0,0 +1,49 @@
+import numpy as np
+from src.enums.detection_mode_enum import DetectionModeEnum
+from src.simulation.spatial_index import GridIndex
+from src.simulation.detection import first_detection_sampled, first_detection_swept
+
+class CoverageRaster:
+    """Earliest time every cell of a (rows, cols) grid came within the search radius of the vehicle.
+
+    Cell (x, y) is the point in column x and row y, the same indexing as `ProbabilityMap`, and is
+    NaN until it is covered. Once the path is painted, objects are detected by looking up their
+    cell instead of searching the path for every object.
+    """
+    def __init__(self, shape: tuple, search_radius: float, detection: DetectionModeEnum = DetectionModeEnum.SAMPLED) -> None:
+        self.times = np.full(shape, np.nan)
+        self.search_radius = search_radius
+        self.detection = detection
+
+        # Cells in row major order so a point's index is also its flat index into `times`
+        x, y = np.meshgrid(np.arange(shape[1]), np.arange(shape[0]))
+        self._index = GridIndex(np.column_stack((x.flatten(), y.flatten())), max(search_radius, 1.0))
+
+    @property
+    def shape(self) -> tuple:
+        return self.times.shape
+
+    @property
+    def covered(self) -> np.ndarray:
+        return ~np.isnan(self.times)
+
+    def paint(self, t: np.ndarray, xy: np.ndarray) -> None:
+        """Paint the flown chunk (t, xy) from `Simulation._fly` onto the raster."""
+        found = self.covered.reshape(-1)
+        if self.detection is DetectionModeEnum.SWEPT:
+            inds, t_found = first_detection_swept(self._index, t, xy, self.search_radius, found)
+        else:
+            inds, t_found = first_detection_sampled(self._index, t[:-1], xy[:-1], self.search_radius, found)
+        self.times.flat[inds] = t_found
+
+    def lookup(self, locations: np.ndarray) -> np.ndarray:
+        """Coverage time of the cell of every (x, y) row of `locations`, NaN if never covered or off the grid.
+
+        Locations off the integer lattice are looked up at their nearest cell.
+        """
+        cells = np.rint(np.asarray(locations, dtype=float).reshape(-1,2)).astype(int)
+        rows, cols = self.shape
+        valid = (cells[:,0] >= 0) & (cells[:,0] < cols) & (cells[:,1] >= 0) & (cells[:,1] < rows)
+        times = np.full(len(cells), np.nan)
+        times[valid] = self.times[cells[valid,1], cells[valid,0]]
+        return times
@@ -0,0 +1,236 @@
+import os
+import numpy as np
+from src.simulation.spatial_index import GridIndex
+from typing import Tuple
+
+def first_detection_sampled(index: GridIndex, t: np.ndarray, xy: np.ndarray, radius: float, found: np.ndarray = None, block: int = 64) -> Tuple[np.ndarray, np.ndarray]:
+    """First time each indexed point is strictly within `radius` of the vehicle positions `xy` sampled at times `t`.
+
+    Points already flagged in `found` are skipped. Returns the indices of the newly detected points
+    and their detection times.
+    """
+    found = None if found is None else np.asarray(found)[None]
+    _, inds, t_found = first_detection_sampled_batch(index, t, np.asarray(xy, dtype=float)[None], radius, found, block)
+    return inds, t_found
+
+def first_detection_swept(index: GridIndex, t: np.ndarray, xy: np.ndarray, radius: float, found: np.ndarray = None, block: int = 64) -> Tuple[np.ndarray, np.ndarray]:
+    """First time each indexed point is strictly within `radius` of the path through the vertices `xy` at times `t`.
+
+    The vehicle is assumed to move in a straight line at constant speed between consecutive vertices,
+    so the sensor sweeps a capsule and entry times are solved analytically instead of being
+    polled at the vertices. Points already flagged in `found` are skipped. Returns the indices of the
+    newly detected points and their detection times.
+    """
+    found = None if found is None else np.asarray(found)[None]
+    _, inds, t_found = first_detection_swept_batch(index, t, np.asarray(xy, dtype=float)[None], radius, found, block)
+    return inds, t_found
+
+def _candidate_pairs(index: GridIndex, xy: np.ndarray, radius: float, found: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # (vehicle, point) pairs of every unfound point near each vehicle's part of the block
+    veh, cand = [], []
+    for i, xy_i in enumerate(xy):
+        if np.all(np.isnan(xy_i)):
+            continue
+        c = index.query(np.nanmin(xy_i, axis=0)-radius, np.nanmax(xy_i, axis=0)+radius)
+        c = c[~found[i, c]]
+        veh.append(np.full(len(c), i))
+        cand.append(c)
+    if len(cand) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    return np.concatenate(veh), np.concatenate(cand)
+
+def first_detection_sampled_batch(index: GridIndex, t: np.ndarray, xy: np.ndarray, radius: float, found: np.ndarray = None, block: int = 64) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """`first_detection_sampled` for several vehicles sampled at the same times `t` in one pass.
+
+    `xy` is (vehicles, len(t), 2) with NaN rows where a vehicle has no sample, and `found` is a
+    (vehicles, points) mask. Every block is searched for all (vehicle, point) pairs at once.
+    Returns the vehicle index, point index and detection time of every new detection.
+    """
+    points = index.points
+    found = np.zeros((len(xy), len(points)), dtype=bool) if found is None else np.copy(found)
+    veh_out, inds_out, t_out = [], [], []
+
+    for k in range(0, len(t), block):
+        xy_block = xy[:, k:k+block]
+        veh, cand = _candidate_pairs(index, xy_block, radius, found)
+        if len(cand) == 0:
+            continue
+
+        dx = xy_block[veh, :, 0].T-points[cand, 0]
+        dy = xy_block[veh, :, 1].T-points[cand, 1]
+        hits = np.sqrt(dx*dx+dy*dy) < radius
+
+        detected = np.any(hits, axis=0)
+        first = np.argmax(hits[:, detected], axis=0)
+        veh, cand = veh[detected], cand[detected]
+
+        found[veh, cand] = True
+        veh_out.append(veh)
+        inds_out.append(cand)
+        t_out.append(t[k:k+block][first])
+
+    if len(inds_out) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0)
+    return np.concatenate(veh_out), np.concatenate(inds_out), np.concatenate(t_out)
+
+def first_detection_swept_batch(index: GridIndex, t: np.ndarray, xy: np.ndarray, radius: float, found: np.ndarray = None, block: int = 64) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """`first_detection_swept` for several vehicles passing their vertices at the same times `t` in one pass.
+
+    `xy` is (vehicles, len(t), 2) with NaN rows where a vehicle has no vertex, and `found` is a
+    (vehicles, points) mask. Every block is searched for all (vehicle, point) pairs at once.
+    Returns the vehicle index, point index and detection time of every new detection.
+    """
+    points = index.points
+    found = np.zeros((len(xy), len(points)), dtype=bool) if found is None else np.copy(found)
+    veh_out, inds_out, t_out = [], [], []
+
+    for k in range(0, max(len(t)-1, 1), block):
+        xy_block = xy[:, k:k+block+1]
+        t_block = t[k:k+block+1]
+        veh, cand = _candidate_pairs(index, xy_block, radius, found)
+        if len(cand) == 0:
+            continue
+
+        # Relative start of every piece to every point and the piece's displacement
+        ax = xy_block[veh, :, 0].T-points[cand, 0]
+        ay = xy_block[veh, :, 1].T-points[cand, 1]
+        inside = np.sqrt(ax*ax+ay*ay) < radius
+        entry = np.where(inside, t_block[:, None], np.inf)
+
+        if xy_block.shape[1] > 1:
+            ax, ay = ax[:-1], ay[:-1]
+            d = np.diff(xy_block, axis=1)[veh]
+            A = np.sum(d*d, axis=2).T
+            B = 2*(ax*d[:, :, 0].T+ay*d[:, :, 1].T)
+            C = ax*ax+ay*ay-radius*radius
+            disc = B*B-4*A*C
+            with np.errstate(divide='ignore', invalid='ignore'):
+                s = (-B-np.sqrt(disc))/(2*A)
+            crossing = (A > 0) & (disc > 0) & (s >= 0) & (s <= 1)
+            t_cross = t_block[:-1, None]+s*np.diff(t_block)[:, None]
+            entry[:-1] = np.minimum(entry[:-1], np.where(crossing, t_cross, np.inf))
+
+        t_entry = np.min(entry, axis=0)
+        detected = np.isfinite(t_entry)
+        veh, cand = veh[detected], cand[detected]
+
+        found[veh, cand] = True
+        veh_out.append(veh)
+        inds_out.append(cand)
+        t_out.append(t_entry[detected])
+
+    if len(inds_out) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0)
+    return np.concatenate(veh_out), np.concatenate(inds_out), np.concatenate(t_out)
+
+def match_rows(haystack: np.ndarray, needles: np.ndarray) -> np.ndarray:
+    """Index of every row of `needles` in the unique rows of `haystack`, or -1 where it does not appear."""
+    haystack = np.asarray(haystack, dtype=float).reshape(-1, 2)
+    needles = np.asarray(needles, dtype=float).reshape(-1, 2)
+    _, inverse = np.unique(np.vstack((haystack, needles)), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    lookup = np.full(np.max(inverse, initial=-1)+1, -1)
+    lookup[inverse[:len(haystack)]] = np.arange(len(haystack))
+    return lookup[inverse[len(haystack):]]
+
+class DetectionLedger:
+    """First detection time of every candidate location, NaN until it is detected.
+
+    The times live in memory unless a `path` is given, in which case they are spilled to a
+    memory mapped .npy file that is removed again by `close()`.
+    """
+    def __init__(self, n: int, path: str = None) -> None:
+        self.path = path
+        if path is None:
+            self.times = np.full(n, np.nan)
+        else:
+            self.times = np.lib.format.open_memmap(path, mode='w+', dtype=float, shape=(n,))
+            self.times[:] = np.nan
+        self.found = np.zeros(n, dtype=bool)
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def record(self, inds: np.ndarray, t: np.ndarray) -> None:
+        new = ~self.found[inds]
+        self.times[inds[new]] = np.asarray(t)[new]
+        self.found[inds[new]] = True
+
+    def detections(self, candidates: np.ndarray, locations: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Join the ledger onto `locations` via the candidate rows they coincide with.
+
+        Returns the indices into `locations` of every detected location and its detection time,
+        ordered by detection time.
+        """
+        cand = match_rows(candidates, locations)
+        inds = np.where(cand >= 0)[0]
+        inds = inds[self.found[cand[inds]]]
+        t = self.times[cand[inds]]
+        order = np.argsort(t, kind='stable')
+        return inds[order], np.array(t[order])
+
+    def close(self) -> None:
+        if self.path is not None:
+            del self.times
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self.path = None
+
+class RadiusLedger:
+    """Running minimum distance of every point to the vehicle and its first time within each of several radii.
+
+    `min_dist` is inf for points that never came within the largest radius and `times` is
+    (radii, points), NaN until a point is detected at that radius. Radii are kept sorted.
+    """
+    def __init__(self, n: int, radii) -> None:
+        self.radii = np.sort(np.asarray(radii, dtype=float).reshape(-1))
+        self.min_dist = np.full(n, np.inf)
+        self.times = np.full((len(self.radii), n), np.nan)
+
+    def __len__(self) -> int:
+        return len(self.min_dist)
+
+    def update(self, index: GridIndex, t: np.ndarray, xy: np.ndarray, swept: bool = False, block: int = 64) -> None:
+        """Fold the flown chunk (t, xy) into the ledger.
+
+        With `swept` the chunk is treated as the vertices of straight pieces like `first_detection_swept`,
+        otherwise as the samples of `first_detection_sampled`.
+        """
+        points = index.points
+        r_max = self.radii[-1]
+
+        for k in range(0, max(len(t)-1, 1) if swept else len(t), block):
+            xy_block = xy[k:k+block+1] if swept else xy[k:k+block]
+            t_block = t[k:k+block+1] if swept else t[k:k+block]
+            cand = index.query(np.min(xy_block, axis=0)-r_max, np.max(xy_block, axis=0)+r_max)
+            if len(cand) == 0:
+                continue
+
+            ax = xy_block[:, 0, None]-points[cand, 0]
+            ay = xy_block[:, 1, None]-points[cand, 1]
+            dist = np.sqrt(ax*ax+ay*ay)
+            entry = np.where(dist[None] < self.radii[:, None, None], t_block[:, None], np.inf)
+
+            if swept and len(xy_block) > 1:
+                ax, ay = ax[:-1], ay[:-1]
+                d = np.diff(xy_block, axis=0)
+                A = np.sum(d*d, axis=1)[:, None]
+                dot = ax*d[:, 0, None]+ay*d[:, 1, None]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    s = np.where(A > 0, np.clip(-dot/A, 0, 1), 0)
+                px, py = ax+s*d[:, 0, None], ay+s*d[:, 1, None]
+                dist = np.vstack((dist, np.sqrt(px*px+py*py)))
+
+                B = 2*dot
+                dt = np.diff(t_block)[:, None]
+                for j, r in enumerate(self.radii):
+                    disc = B*B-4*A*(ax*ax+ay*ay-r*r)
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        s = (-B-np.sqrt(disc))/(2*A)
+                    crossing = (A > 0) & (disc > 0) & (s >= 0) & (s <= 1)
+                    entry[j, :-1] = np.minimum(entry[j, :-1], np.where(crossing, t_block[:-1, None]+s*dt, np.inf))
+
+            self.min_dist[cand] = np.minimum(self.min_dist[cand], np.min(dist, axis=0))
+            t_entry = np.min(entry, axis=1)
+            self.times[:, cand] = np.where(np.isnan(self.times[:, cand]) & np.isfinite(t_entry), t_entry, self.times[:, cand])
+
@@ -0,0 +1,21 @@
+import numpy as np
+from src.enums.sim_event_enum import SimEventEnum
+from src.enums.stop_reason_enum import StopReasonEnum
+
+class SimEvent:
+    """One event of `Simulation.iter_events`.
+
+    DETECTION events hold the detected cell in `location` and the number of objects in it in `count`,
+    SNAPSHOT events the vehicle position and STOP events the `stop_reason`. `found_fraction` is the
+    running fraction of the objects found up to and including the event.
+    """
+    def __init__(self, kind: SimEventEnum, t: float, found_fraction: float, location: np.ndarray = None, count: int = 0, stop_reason: StopReasonEnum = None) -> None:
+        self.kind = kind
+        self.t = t
+        self.found_fraction = found_fraction
+        self.location = location
+        self.count = count
+        self.stop_reason = stop_reason
+
+    def __repr__(self) -> str:
+        return f"SimEvent({self.kind}, t={self.t:.2f}s, found {100*self.found_fraction:.2f}%)"
@@ -0,0 +1,140 @@
+from src.enums.waypoint_algorithm_enum import WaypointAlgorithmEnum
+from src.enums.detection_mode_enum import DetectionModeEnum
+from src.enums.stop_reason_enum import StopReasonEnum
+from loguru import logger
+import numpy as np
+from src.simulation.simulation import Simulation
+from src.simulation.vehicle import VehicleSimData
+from src.simulation.trajectory import Trajectories, _horner
+from src.simulation.spatial_index import GridIndex
+from src.simulation.detection import DetectionLedger, first_detection_sampled_batch, first_detection_swept_batch
+from src.simulation.parameters import *
+from src.data_models.positional.waypoint import Waypoints
+from typing import List, Tuple
+
+class LockstepSimulation:
+    """Simulate several paths against the same objects by advancing all vehicles together.
+
+    Every vehicle is a row of the state arrays and all rows are stepped with the arithmetic of
+    `Vehicle.step`, so the per path results are identical to separate `Simulation.run` calls.
+    Vehicles that finished their path are padded, i.e. their state is frozen and their positions
+    are NaN for the detection, which checks every vehicle in the same pass.
+    """
+    def __init__(self, waypoints: List[Waypoints], searched_object_locations: Waypoints, search_radius: float, mean_flight_speed: float, algs: List[WaypointAlgorithmEnum] = None, detection: DetectionModeEnum = DetectionModeEnum.SAMPLED, dt: float = dt, object_counts: np.ndarray = None):
+        algs = [WaypointAlgorithmEnum.UNKNOWN]*len(waypoints) if algs is None else algs
+        self.simulations = [Simulation(wps, searched_object_locations, search_radius, mean_flight_speed, alg=alg, detection=detection, dt=dt, object_counts=object_counts) for wps, alg in zip(waypoints, algs)]
+        self.search_radius = search_radius
+        self.detection = detection
+        self.dt = dt
+
+    def __len__(self) -> int:
+        return len(self.simulations)
+
+    def _plan(self) -> Tuple[List[np.ndarray], List[np.ndarray], np.ndarray]:
+        # Segment coefficients, first global step of every segment, every step's time into its segment and total steps of every vehicle
+        coeffs, starts, local, n_steps = [], [], [], []
+        for simulation in self.simulations:
+            simulation.trajectories = Trajectories.from_waypoints(simulation.waypoints, simulation.mean_flight_speed)
+            t_local = [f.sample_times(self.dt) for f in simulation.trajectories]
+            steps = np.array([len(f) for f in t_local], dtype=int)
+            coeffs.append(simulation.trajectories.coeff_array)
+            starts.append(np.concatenate(([0], np.cumsum(steps)[:-1])).astype(int))
+            local.append(np.concatenate(t_local) if len(t_local) > 0 else np.zeros(0))
+            n_steps.append(int(np.sum(steps)))
+        return coeffs, starts, local, np.array(n_steps, dtype=int)
+
+    def _fly(self):
+        """Fly all paths chunk by chunk.
+
+        Yields the times at the start of every step in the chunk with the time after the last step
+        appended, (n+1,), and the matching vehicle positions as (vehicles, n+1, 2), NaN where a
+        vehicle's path has ended.
+        """
+        coeffs, starts, local, n_steps = self._plan()
+        vehicles = [f.vehicle for f in self.simulations]
+        every = max(int(0.5/self.dt), 1)
+
+        # Longest paths first so the vehicles still flying are always a leading slice
+        order = np.argsort(-n_steps, kind='stable')
+        n_sorted = n_steps[order]
+        pos = np.array([[vehicles[i].pos.x, vehicles[i].pos.y] for i in order], dtype=float).reshape(-1,2)
+        dpos = np.array([[vehicles[i].dpos.x, vehicles[i].dpos.y] for i in order], dtype=float).reshape(-1,2)
+        ddpos = np.array([[vehicles[i].ddpos.x, vehicles[i].ddpos.y] for i in order], dtype=float).reshape(-1,2)
+        # Every vehicle accumulates the same global time step after step
+        times = np.add.accumulate(np.concatenate(([0.0], np.full(int(np.max(n_steps, initial=0)), self.dt))))
+
+        for chunk_start in range(0, int(np.max(n_steps, initial=0)), chunk_size):
+            n = min(chunk_size, int(n_sorted[0])-chunk_start)
+            n_active = np.sum(n_sorted[:, None] > chunk_start+np.arange(n), axis=0)
+
+            # Desired accelerations of every flying vehicle from its polynomial segments
+            des_acc = np.zeros((len(order), n, 2))
+            for row, i in enumerate(order[:n_active[0]]):
+                steps = np.arange(chunk_start, min(chunk_start+n, n_steps[i]))
+                seg = np.searchsorted(starts[i], steps, side='right')-1
+                des_acc[row, :len(steps)] = _horner(coeffs[i][seg], local[i][steps])[2]
+
+            xy = np.full((len(order), n+1, 2), np.nan)
+            xy[:n_active[0], 0] = pos[:n_active[0]]
+            vel = np.zeros((len(order), n, 2))
+            acc = np.zeros((len(order), n, 2))
+            for k in range(n):
+                a = n_active[k]
+                F_D = 10*np.square(dpos[:a])
+
+                ## Controller
+                T = m*des_acc[:a, k] + F_D
+
+                ## Dynamics and Euler integration
+                ddpos[:a] = (T-F_D)/m
+                dpos[:a] += ddpos[:a] * self.dt
+                pos[:a] += dpos[:a] * self.dt
+
+                xy[:a, k+1] = pos[:a]
+                vel[:a, k] = dpos[:a]
+                acc[:a, k] = ddpos[:a]
+
+            # Store samples on the steps `Vehicle.step` would store them
+            for row, i in enumerate(order[:n_active[0]]):
+                vehicle = vehicles[i]
+                n_v = min(n, n_steps[i]-chunk_start)
+                t = np.add.accumulate(np.concatenate(([vehicle.t], np.full(n_v, self.dt))))
+                stored = (vehicle.c+np.arange(n_v)) % every == 0
+                vehicle.data.extend(t[:-1][stored], xy[row, 1:n_v+1][stored], vel[row, :n_v][stored], acc[row, :n_v][stored])
+                vehicle.pos.x, vehicle.pos.y = pos[row]
+                vehicle.dpos.x, vehicle.dpos.y = dpos[row]
+                vehicle.ddpos.x, vehicle.ddpos.y = ddpos[row]
+                vehicle.t = t[-1]
+                vehicle.c += n_v
+
+            unsorted = np.empty_like(xy)
+            unsorted[order] = xy
+            yield times[chunk_start:chunk_start+n+1], unsorted
+
+        # Every path is always flown to its end
+        for simulation in self.simulations:
+            simulation.t_end = simulation.vehicle.t
+            simulation.vehicle.data.stop_reason = StopReasonEnum.COMPLETED
+
+    def detect(self, index: GridIndex, t: np.ndarray, xy: np.ndarray, found: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Search the chunk (t, xy) from `_fly` for the points in `index` for every vehicle at once.
+
+        Returns the vehicle index, point index and detection time of every new detection.
+        """
+        if self.detection is DetectionModeEnum.SWEPT:
+            return first_detection_swept_batch(index, t, xy, self.search_radius, found)
+        return first_detection_sampled_batch(index, t[:-1], xy[:, :-1], self.search_radius, found)
+
+    def run(self) -> List[VehicleSimData]:
+        logger.info(f"Lockstep simulation of {len(self)} paths", enqueue=True)
+        objs_possible_xy = self.simulations[0]._candidates() if len(self) > 0 else np.zeros((0,2))
+
+        index = GridIndex(objs_possible_xy, max(self.search_radius, 1.0))
+        ledgers = [DetectionLedger(len(objs_possible_xy)) for _ in self.simulations]
+
+        for t, xy in self._fly():
+            veh, inds, t_found = self.detect(index, t, xy, np.array([f.found for f in ledgers]).reshape(len(self), -1))
+            for i, ledger in enumerate(ledgers):
+                ledger.record(inds[veh == i], t_found[veh == i])
+
+        return [simulation._collect(ledger, objs_possible_xy) for simulation, ledger in zip(self.simulations, ledgers)]
@@ -0,0 +1,58 @@
+import numpy as np
+from loguru import logger
+from src.data_models.probability_map import ProbabilityMap
+from src.simulation.simulation import Simulation
+from src.simulation.spatial_index import GridIndex
+from src.simulation.vehicle import VehicleSimData
+
+class MonteCarloResult:
+    """Detection statistics of one flown path against many independently placed object sets.
+
+    `found_fraction` holds the fraction of objects found per set and `detection_times` the sorted
+    detection times of the found objects of every set.
+    """
+    def __init__(self, found_fraction: list = [], detection_times: list = [], n_objects: int = 0, seed: int = None, vehicle_data: VehicleSimData = None) -> None:
+        self.found_fraction = np.asarray(found_fraction, dtype=float)
+        self.detection_times = [np.asarray(f, dtype=float) for f in detection_times]
+        self.n_objects = n_objects
+        self.seed = seed
+        self.vehicle_data = vehicle_data
+
+    @property
+    def n_sets(self) -> int:
+        return len(self.found_fraction)
+
+    def __str__(self) -> str:
+        return f"MonteCarloResult({self.n_sets} sets of {self.n_objects}, found {100*np.mean(self.found_fraction):.2f}% +- {100*np.std(self.found_fraction):.2f}%)"
+
+def run_monte_carlo(simulation: Simulation, prob_map: ProbabilityMap, n_sets: int, n_objects: int, seed: int = None) -> MonteCarloResult:
+    """Fly the simulation's path once and evaluate `n_sets` object placements against it.
+
+    Every set of `n_objects` is drawn from `prob_map` with its own stream spawned from a single
+    `numpy.random.SeedSequence`, so a run is reproducible from its seed. All placed cells are searched
+    in one detection pass and the detections are then split back out per set.
+    """
+    seed_seq = np.random.SeedSequence(seed)
+    sets = [prob_map.place_array(n_objects, np.random.default_rng(f)) for f in seed_seq.spawn(n_sets)]
+
+    cells, inverse = np.unique(np.vstack(sets), axis=0, return_inverse=True)
+    inverse = inverse.reshape(n_sets, n_objects)
+    logger.info(f"{simulation.alg} - Monte Carlo with {n_sets} sets of {n_objects} objects over {len(cells)} unique cells", enqueue=True)
+
+    if simulation.coverage_shape is not None:
+        cell_times = simulation.paint_coverage().lookup(cells)
+    else:
+        t, xy = simulation.fly()
+        inds, t_found = simulation.detect(GridIndex(cells, max(simulation.search_radius, 1.0)), t, xy)
+        cell_times = np.full(len(cells), np.nan)
+        cell_times[inds] = t_found
+
+    times = cell_times[inverse]
+    found = ~np.isnan(times)
+    result = MonteCarloResult(found_fraction=np.mean(found, axis=1),
+                              detection_times=[np.sort(f[~np.isnan(f)]) for f in times],
+                              n_objects=n_objects,
+                              seed=seed_seq.entropy,
+                              vehicle_data=simulation.vehicle.data)
+    logger.info(f"{simulation.alg} - {result}", enqueue=True)
+    return result
@@ -0,0 +1,60 @@
+import numpy as np
+from loguru import logger
+from src.enums.detection_mode_enum import DetectionModeEnum
+from src.simulation.simulation import Simulation
+from src.simulation.spatial_index import GridIndex
+from src.simulation.detection import RadiusLedger
+from src.simulation.vehicle import VehicleSimData
+
+class MultiRadiusResult:
+    """Detection statistics of one flown path for a whole vector of search radii.
+
+    `found_fraction` holds the fraction of objects found per radius and `detection_times` the sorted
+    detection times of the found objects per radius. `min_distance` is the closest the vehicle
+    came to each of the unique object `cells`, holding `counts` objects each (inf if it never came
+    within the largest radius).
+    """
+    def __init__(self, radii: list = [], found_fraction: list = [], detection_times: list = [], min_distance: list = [], cells: list = [], counts: list = [], vehicle_data: VehicleSimData = None) -> None:
+        self.radii = np.asarray(radii, dtype=float)
+        self.found_fraction = np.asarray(found_fraction, dtype=float)
+        self.detection_times = [np.asarray(f, dtype=float) for f in detection_times]
+        self.min_distance = np.asarray(min_distance, dtype=float)
+        self.cells = np.asarray(cells, dtype=float).reshape(-1,2)
+        self.counts = np.asarray(counts, dtype=int)
+        self.vehicle_data = vehicle_data
+
+    @property
+    def n_objects(self) -> int:
+        return int(np.sum(self.counts))
+
+    def __str__(self) -> str:
+        found = ", ".join(f"r={r:g}: {100*f:.2f}%" for r, f in zip(self.radii, self.found_fraction))
+        return f"MultiRadiusResult({self.n_objects} objects, found {found})"
+
+def run_multi_radius(simulation: Simulation, radii: list) -> MultiRadiusResult:
+    """Fly the simulation's path once and evaluate its objects for every radius in `radii`.
+
+    The simulation's own `search_radius` is ignored. For every radius the detections match a
+    separate run of the simulation with that radius.
+    """
+    cells, counts = simulation.searched_object_locations, simulation.object_counts
+    ledger = RadiusLedger(len(cells), radii)
+    index = GridIndex(cells, max(ledger.radii[-1], 1.0))
+    logger.info(f"{simulation.alg} - Multi radius search for radii {ledger.radii.tolist()}", enqueue=True)
+
+    for t, xy in simulation.flown():
+        if simulation.detection is DetectionModeEnum.SWEPT:
+            ledger.update(index, t, xy, swept=True)
+        else:
+            ledger.update(index, t[:-1], xy[:-1])
+
+    found = ~np.isnan(ledger.times)
+    result = MultiRadiusResult(radii=ledger.radii,
+                               found_fraction=[np.sum(counts[f])/max(np.sum(counts),1) for f in found],
+                               detection_times=[np.sort(np.repeat(times[f], counts[f])) for times, f in zip(ledger.times, found)],
+                               min_distance=ledger.min_dist,
+                               cells=cells,
+                               counts=counts,
+                               vehicle_data=simulation.vehicle.data)
+    logger.info(f"{simulation.alg} - {result}", enqueue=True)
+    return result
@@ -7,6 +7,9 @@ m = 6.14
 size = 0.25
 dt = 0.01
 
+# Time steps sampled from a trajectory per batch
+chunk_size = 1000
+
 # Map size
 n = 200
 m = 200
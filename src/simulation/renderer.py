@@ -0,0 +1,142 @@
+import time
+import numpy as np
+import matplotlib.pyplot as plt
+from src.simulation.parameters import size
+from src.simulation.vehicle import VehicleSimData
+from src.data_models.positional.waypoint import Waypoints
+
+class Renderer:
+    """Animation of a running simulation, decoupled from the integration.
+
+    The simulation pushes its samples into a ring buffer holding the latest `history` samples and
+    the renderer draws at most `fps` frames per wall clock second. Every artist is created once and
+    blitted onto a cached background, which is only redrawn when the axes limits have to grow.
+    """
+    def __init__(self, waypoints: Waypoints, history: int = 2000, fps: float = 30.0) -> None:
+        self.fps = fps
+        self._last_frame = -np.inf
+        self._seen = 0
+
+        # Ring buffer of (t, x, y, dx, dy, ddx, ddy) rows, `_n` is the number of samples ever pushed
+        self._buffer = np.zeros((history, 7))
+        self._n = 0
+        self._found = np.zeros((0,2))
+
+        plt.ion()
+        self.fig = plt.figure()
+        self.fig.canvas.mpl_connect('key_release_event',
+                lambda event: [exit(0) if event.key == 'escape' else None])
+        self.fig.canvas.mpl_connect('resize_event', lambda event: setattr(self, '_background', None))
+        self._background = None
+
+        ax = self.fig.add_subplot(211)
+        ax.set_aspect('equal',adjustable='box')
+        ax.scatter(waypoints.x,waypoints.y,c='g',s=2)
+        margin = 2*size+1
+        ax.set_xlim(np.min(waypoints.x)-margin, np.max(waypoints.x)+margin)
+        ax.set_ylim(np.min(waypoints.y)-margin, np.max(waypoints.y)+margin)
+        ax.set_ylabel("y ($m$)")
+        ax.set_xlabel("x ($m$)")
+        self._path, = ax.plot([], [], 'b:', animated=True)
+        self._velocity, = ax.plot([], [], 'k-', animated=True)
+        self._objects, = ax.plot([], [], 'rx', markersize=3, animated=True)
+        self._vehicle = ax.add_patch(plt.Circle((0,0), size, color='r', animated=True))
+        self._time = ax.text(0.1,0.9,"",ha='center', va='center', transform=ax.transAxes, animated=True)
+
+        self._axes = []
+        self._lines = []
+        for pos, ylabel, labels in ((234, "position ($m$)", (r'$\vec p_x$', r'$\vec p_y$')),
+                                    (235, "speed ($ms^{-1}$)", (r'$\dot \vec p_x$', r'$\dot \vec p_y$', r'$|\dot \vec p|$')),
+                                    (236, "acceleration ($m^2 s^{-1}$)", (r'$\ddot \vec p_x$', r'$\ddot \vec p_y$', r'$|\ddot \vec p|$'))):
+            ax = self.fig.add_subplot(pos)
+            ax.set_ylabel(ylabel)
+            ax.set_xlabel("$t$ ($s$)")
+            ax.set_xlim(0, 1)
+            ax.set_ylim(-1, 1)
+            self._lines.append([ax.plot([], [], label=f, animated=True)[0] for f in labels])
+            ax.legend()
+            self._axes.append(ax)
+
+    @property
+    def history(self) -> int:
+        return len(self._buffer)
+
+    def samples(self) -> np.ndarray:
+        """The buffered samples in time order as (n, 7) rows of t, position, velocity and acceleration."""
+        if self._n <= self.history:
+            return self._buffer[:self._n]
+        i = self._n % self.history
+        return np.vstack((self._buffer[i:], self._buffer[:i]))
+
+    def push(self, t: np.ndarray, pos: np.ndarray, dpos: np.ndarray, ddpos: np.ndarray) -> None:
+        rows = np.column_stack((t, pos, dpos, ddpos))[-self.history:]
+        self._buffer[(self._n+np.arange(len(rows))) % self.history] = rows
+        self._n += len(rows)
+
+    def set_found(self, locations: np.ndarray) -> None:
+        self._found = np.asarray(locations, dtype=float).reshape(-1,2)
+
+    def update(self, data: VehicleSimData, force: bool = False) -> None:
+        """Push the samples `data` gained since the last update and draw a frame if one is due."""
+        if len(data) > self._seen:
+            self.push(data.t[self._seen:], data.pos.toNumpyArray()[self._seen:], data.dpos.toNumpyArray()[self._seen:], data.ddpos.toNumpyArray()[self._seen:])
+        self._seen = len(data)
+
+        # Frames are spaced from the end of the previous one so the simulation always gets time to run
+        if force or time.perf_counter()-self._last_frame >= 1/self.fps:
+            self.draw()
+            self._last_frame = time.perf_counter()
+
+    def _artists(self) -> list:
+        return [self._path, self._velocity, self._objects, self._vehicle, self._time]+[f for lines in self._lines for f in lines]
+
+    def _rescale(self, t: np.ndarray, series: list) -> bool:
+        # Grow the limits with some headroom so the background rarely has to be redrawn
+        stale = False
+        for ax, values in zip(self._axes, series):
+            x0, x1 = ax.get_xlim()
+            y0, y1 = ax.get_ylim()
+            lo, hi = np.min(values), np.max(values)
+            if t[-1] > x1 or t[0] > x0+(x1-x0)/2:
+                ax.set_xlim(t[0], t[-1]+(t[-1]-t[0])/2+1)
+                stale = True
+            if lo < y0 or hi > y1:
+                pad = (max(hi, y1)-min(lo, y0))/4
+                ax.set_ylim(min(lo, y0)-pad, max(hi, y1)+pad)
+                stale = True
+        return stale
+
+    def draw(self) -> None:
+        samples = self.samples()
+        if len(samples) == 0:
+            return
+        t, x, y, dx, dy, ddx, ddy = samples.T
+        series = [(x, y), (dx, dy, np.hypot(dx, dy)), (ddx, ddy, np.hypot(ddx, ddy))]
+
+        self._path.set_data(x, y)
+        self._velocity.set_data([x[-1], x[-1]+dx[-1]], [y[-1], y[-1]+dy[-1]])
+        self._objects.set_data(self._found[:,0], self._found[:,1])
+        self._vehicle.center = x[-1], y[-1]
+        self._time.set_text(f"t=${t[-1]:.2f}s$")
+        for lines, values in zip(self._lines, series):
+            for line, v in zip(lines, values):
+                line.set_data(t, v)
+
+        canvas = self.fig.canvas
+        if self._rescale(t, [np.concatenate(f) for f in series]) or self._background is None:
+            canvas.draw()
+            self._background = canvas.copy_from_bbox(self.fig.bbox)
+        else:
+            canvas.restore_region(self._background)
+        for artist in self._artists():
+            artist.axes.draw_artist(artist)
+        canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+
+    def show(self, data: VehicleSimData) -> None:
+        """Draw the final state and block until the window is closed."""
+        self.update(data, force=True)
+        for artist in self._artists():
+            artist.set_animated(False)
+        plt.ioff()
+        plt.show(block=True)
@@ -0,0 +1,68 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+import numpy as np
+from loguru import logger
+from src.enums.detection_mode_enum import DetectionModeEnum
+from src.enums.stop_reason_enum import StopReasonEnum
+from src.shared_memory_helper import SharedArray
+from src.simulation.simulation import Simulation
+from src.simulation.spatial_index import GridIndex
+from src.simulation.detection import DetectionLedger, first_detection_sampled, first_detection_swept
+from src.simulation.vehicle import VehicleSimData
+from typing import Tuple
+
+def detect_shard(t_spec, xy_spec, cells_spec, shard: int, n_shards: int, radius: float, detection: DetectionModeEnum) -> Tuple[np.ndarray, np.ndarray]:
+    """Search the shared flown path for every `n_shards`-th shared cell starting at `shard`.
+
+    Returns the indices into the shared cells of the detected cells and their detection times.
+    """
+    with SharedArray.attach(t_spec) as t, SharedArray.attach(xy_spec) as xy, SharedArray.attach(cells_spec) as cells:
+        inds = np.arange(shard, len(cells.array), n_shards)
+        index = GridIndex(cells.array[inds], max(radius, 1.0))
+        if detection is DetectionModeEnum.SWEPT:
+            found, t_found = first_detection_swept(index, t.array, xy.array, radius)
+        else:
+            found, t_found = first_detection_sampled(index, t.array[:-1], xy.array[:-1], radius)
+    return inds[found], t_found
+
+# Starting the pool and copying the path into shared memory takes ~0.5s, while the detection
+# costs in the order of 10us per object cell on a 40 waypoint path over a 600x600 map. Below
+# this many cells per worker the pool costs more than splitting the detection saves.
+MIN_CELLS_PER_WORKER = 50000
+
+def run_sharded(simulation: Simulation, workers: int = None, min_cells_per_worker: int = MIN_CELLS_PER_WORKER) -> VehicleSimData:
+    """`Simulation.run` with the detection split over a pool of `workers` processes.
+
+    The path is flown once and shared with the workers, which each search an interleaved shard of
+    the object cells so every shard is spread over the whole map. The shard detections are merged
+    into one ledger and give the same result as `Simulation.run`. Fewer workers are used if there
+    are less than `min_cells_per_worker` cells for each and with a single worker the simulation is
+    run in process instead.
+    """
+    cells = simulation.searched_object_locations
+    workers = min(workers or os.cpu_count(), len(cells)//max(min_cells_per_worker, 1))
+    if simulation.coverage_shape is not None or workers <= 1:
+        # Coverage detection is a lookup already and a single worker only adds the pool overhead
+        return simulation.run()
+
+    t, xy = simulation.fly()
+    logger.info(f"{simulation.alg} - Sharded detection of {len(cells)} cells over {workers} workers", enqueue=True)
+
+    ledger = DetectionLedger(len(cells), path=simulation.ledger_path)
+    with SharedArray.create(t) as shared_t, SharedArray.create(xy) as shared_xy, SharedArray.create(cells) as shared_cells, ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(detect_shard, shared_t.spec, shared_xy.spec, shared_cells.spec, i, workers, simulation.search_radius, simulation.detection) for i in range(workers)]
+        for future in futures:
+            ledger.record(*future.result())
+
+    # The target found fraction can only be applied once all shards are in
+    if simulation.target_found_fraction is not None:
+        inds = np.where(ledger.found)[0]
+        t_found = np.array(ledger.times[inds])
+        ledger.found[:] = False
+        inds, t_found, t_stop = simulation._until_target(ledger, inds, t_found)
+        ledger.times[:] = np.nan
+        ledger.record(inds, t_found)
+        if t_stop is not None:
+            simulation._stop(StopReasonEnum.ALL_FOUND if np.all(ledger.found) else StopReasonEnum.FOUND_FRACTION, t_stop)
+
+    return simulation._collect(ledger, cells)
@@ -1,211 +1,355 @@
-import os
-import diskcache as dc
 from src.waypoint_generation.waypoint_settings import SarGenOutput, WaypointAlgSettings
 from src.enums.waypoint_algorithm_enum import WaypointAlgorithmEnum
+from src.enums.detection_mode_enum import DetectionModeEnum
+from src.enums.integrator_enum import IntegratorEnum
+from src.enums.stop_reason_enum import StopReasonEnum
+from src.enums.sim_event_enum import SimEventEnum
 from loguru import logger
 import numpy as np
+import hashlib
+import os
 from src.simulation.vehicle import Vehicle, VehicleSimData
-from src.simulation.trajectory import Trajectory, Trajectories
+from src.simulation.trajectory import Trajectories
+from src.simulation.spatial_index import GridIndex
+from src.simulation.coverage import CoverageRaster
+from src.simulation.events import SimEvent
+from src.simulation.renderer import Renderer
+from src.simulation.detection import DetectionLedger, first_detection_sampled, first_detection_swept
+from src.array_helper import unique_counts
 from src.simulation.parameters import *
-from src.data_models.positional.waypoint import Waypoint, Waypoints
+from src.data_models.positional.waypoint import Waypoints
 from src.data_models.positional.pose import Pose
-from typing import List, Tuple
-import matplotlib.pyplot as plt
-import tempfile
-import time
+from typing import Tuple
 
 class SimRunnerOutput:
     def __init__(self) -> None:
         self.data = []
+        self.monte_carlo = []
+        self.multi_radius = []
+        self.success = []
 
     def add_simulation_data(self, sim_output: VehicleSimData, alg: WaypointAlgorithmEnum):
         assert(isinstance(sim_output, VehicleSimData))
         assert(isinstance(alg, WaypointAlgorithmEnum))
         self.data.append((alg, sim_output))
 
+    def add_monte_carlo_data(self, mc_output, alg: WaypointAlgorithmEnum):
+        assert(isinstance(alg, WaypointAlgorithmEnum))
+        self.monte_carlo.append((alg, mc_output))
+
+    def add_multi_radius_data(self, mr_output, alg: WaypointAlgorithmEnum):
+        assert(isinstance(alg, WaypointAlgorithmEnum))
+        self.multi_radius.append((alg, mr_output))
+
+    def add_success_data(self, success_output, alg: WaypointAlgorithmEnum):
+        assert(isinstance(alg, WaypointAlgorithmEnum))
+        self.success.append((alg, success_output))
+
 
 class Simulation:
-    def __init__(self, waypoints: Waypoints, searched_object_locations: Waypoints, search_radius: float, mean_flight_speed: float, animate: bool = False,alg:WaypointAlgorithmEnum=WaypointAlgorithmEnum.UNKNOWN):
+    def __init__(self, waypoints: Waypoints, searched_object_locations: Waypoints, search_radius: float, mean_flight_speed: float, animate: bool = False,alg:WaypointAlgorithmEnum=WaypointAlgorithmEnum.UNKNOWN, detection: DetectionModeEnum = DetectionModeEnum.SAMPLED, dt: float = dt, ledger_path: str = None, integrator: IntegratorEnum = IntegratorEnum.SCALAR, object_counts: np.ndarray = None, trajectory_cache: str = None, coverage_shape: tuple = None, max_time: float = None, endurance: float = None, target_found_fraction: float = None):
 
         self.waypoints = waypoints
 
-        self.vehicle = Vehicle(pos=Pose.fromWP(self.waypoints[0]))
+        self.dt = dt
+        self.vehicle = Vehicle(pos=Pose.fromWP(self.waypoints[0]), dt=self.dt)
         self.trajectories = Trajectories()
         self.animate = animate
         self.alg = alg
-        if self.animate:
-            plt.ion()
-            fig = plt.figure()
-            fig.canvas.mpl_connect('key_release_event',
-                    lambda event: [exit(0) if event.key == 'escape' else None])
-            self._ax_pos = fig.add_subplot(211)
-            self._ax_xy = fig.add_subplot(234)
-            self._ax_dxy = fig.add_subplot(235)
-            self._ax_ddxy = fig.add_subplot(236)
-
+        self.detection = detection
+        self.integrator = integrator
+        self.ledger_path = ledger_path
+        self.trajectory_cache = trajectory_cache
+        self.coverage_shape = coverage_shape
+
+        # Stop conditions, None disables them
+        self.max_time = max_time
+        self.endurance = endurance
+        self.target_found_fraction = target_found_fraction
+        # Time the flight ended, set once the path is flown or stopped
+        self.t_end = None
+        self.renderer = Renderer(self.waypoints) if self.animate else None
 
         self.wp_settings = WaypointAlgSettings.Global()
 
         self.search_radius = search_radius
         self.mean_flight_speed = mean_flight_speed
-        self.searched_object_locations = searched_object_locations.toNumpyArray()
-        self.num_objs = len(self.searched_object_locations)
+        # Objects are held as the unique occupied cells weighted by the number of objects in each
+        if searched_object_locations is None:
+            searched_object_locations = Waypoints([])
+        if isinstance(searched_object_locations, SarGenOutput):
+            object_counts = searched_object_locations.counts
+            searched_object_locations = searched_object_locations.cells
+        if not isinstance(searched_object_locations, np.ndarray):
+            searched_object_locations = searched_object_locations.toNumpyArray()
+        cells, self.object_counts = unique_counts(np.array(searched_object_locations,dtype=float).reshape(-1,2), object_counts)
+        self.searched_object_locations = cells.astype(float)
+        self.num_objs = int(np.sum(self.object_counts))
 
 
         logger.info(
-            f"{alg} - Running simulation with {len(waypoints)} waypoints and {len(searched_object_locations)} searched objects with search radius = {self.search_radius}",enqueue=True)
+            f"{alg} - Running simulation with {len(waypoints)} waypoints and {self.num_objs} searched objects in {len(self.searched_object_locations)} cells with search radius = {self.search_radius} ({self.detection}, {self.integrator}, dt={self.dt})",enqueue=True)
 
-    def run(self) -> VehicleSimData:
-        bounds = []
-        bounds.append((self.waypoints[0],Pose.zero()))
-        for wp_a, wp_b, wp_c in zip(self.waypoints[:-2],self.waypoints[1:-1],self.waypoints[2:]):
-            a = np.array(wp_a)
-            b = np.array(wp_b)
-            c = np.array(wp_c)
-
-            rAC = c-a
-            rBA = a-b
-            rBC = c-b
-            rAC_unit = rAC/np.clip(np.linalg.norm(rAC),1e-6,np.inf) 
-            theta = rBA.dot(rBC)/(np.linalg.norm(rBA)*np.linalg.norm(rBC))
-            chi = np.power((1-theta)/2,3)
-            vB = Pose(self.mean_flight_speed*rAC_unit*chi)
-            bounds.append((wp_b,vB))
-        bounds.append((self.waypoints[-1],Pose.zero()))
-
-        for (wp1,v1),(wp2,v2) in zip(bounds[:-1],bounds[1:]):
-                
-            a = np.array(wp1)
-            b = np.array(wp2)
-
-            dist = np.linalg.norm(b-a)
-            t = dist/self.mean_flight_speed
-
-            trajectory = Trajectory(start_pos=wp1,
-                                    dest_pos=wp2,
-                                    T=t,
-                                    start_vel=v1,
-                                    dest_vel=v2,)
-            self.trajectories.add(trajectory)
-
-        t = 0
-        max_x,max_y = np.max(self.searched_object_locations,axis=0)
-        min_x,min_y = np.min(self.searched_object_locations,axis=0)
-        x,y = np.meshgrid(np.arange(min_x,max_x+1),np.arange(min_y,max_y+1))
-        x,y=x.flatten(),y.flatten()
-        objs_possible_xy = np.vstack((x,y)).T
-
-        np.random.seed(int(time.time()*len(self.alg)*len(self.waypoints)))
-        cache_path = os.path.join(tempfile.gettempdir(),'opp4sar',str(np.random.rand())[2:])
-        cache = dc.Cache(cache_path)
-        logger.trace(f"{self.alg} - Cache path = {cache_path}",enqueue=True)
-                
-        for i,trajectory in enumerate(self.trajectories):
-            t_local = 0
+    def _candidates(self) -> np.ndarray:
+        return self.searched_object_locations
 
-            logger.trace(
-                f"{self.alg} - Trajectory {i}/{len(self.trajectories)} with T={trajectory.T:.2f}s", enqueue=True)
-            while t_local <= trajectory.T:
-                # Search for object
-                if self.searched_object_locations is not None:
+    def _fly(self):
+        """Fly every trajectory chunk by chunk.
 
-                    # create distance vectors
-                    v = np.array([self.vehicle.pos.x-objs_possible_xy[:,0],
-                                  self.vehicle.pos.y-objs_possible_xy[:, 1]])
+        Yields the times and vehicle positions at the start of every step in the chunk with the
+        position after the chunk's last step appended, i.e. (n+1,) and (n+1, 2) arrays.
+        """
+        self.trajectories = Trajectories.from_waypoints(self.waypoints, self.mean_flight_speed)
 
-                    # if distance is < search radius -> object found
-                    dist = np.linalg.norm(v, axis=0)
+        t = 0.0
+        for i,trajectory in enumerate(self.trajectories):
+            t_local = trajectory.sample_times(self.dt)
+            # The global time keeps accumulating dt over the segments
+            t_global = np.add.accumulate(np.concatenate(([t], np.full(len(t_local), self.dt))))
 
-                    if any(dist < self.search_radius):
-                        inds = np.where(dist < self.search_radius)[0]
-                        for ind in inds:
-                            loc = objs_possible_xy[ind]
-                            cache[f'{loc[0]},{loc[1]}'] = t                            
-                        objs_possible_xy = np.delete(objs_possible_xy, inds, axis=0)
+            logger.trace(
+                f"{self.alg} - Trajectory {i}/{len(self.trajectories)} with T={trajectory.T:.2f}s", enqueue=True)
+            for chunk_start in range(0, len(t_local), chunk_size):
+                chunk = np.arange(chunk_start, min(chunk_start+chunk_size, len(t_local)))
 
                 # Calc desired position, velocity and acceleration from generated polynomial trajectory
-                des_pos = trajectory.position(t_local)
-                des_vel = trajectory.velocity(t_local)
-                des_acc = trajectory.acceleration(t_local)
-
-                # Step the vehicle
-                self.vehicle.step(des_pos, des_vel, des_acc)
-
-                # Update time
-                t_local += dt
-                t += dt
-
-                if t_local==dt and self.animate:
-                    self._plot()
-                    
-        for key in cache.iterkeys():
-            t = cache[key]
-            xy=tuple(np.array(key.split(',')).astype(float).astype(int))
-            inds = np.where((self.searched_object_locations[:,0]==xy[0])&(self.searched_object_locations[:,1]==xy[1]))[0]
-            for ind in inds:
-                self.vehicle.data.found.append(
-                    (t,self.searched_object_locations[ind])
-                )
+                des_pos, des_vel, des_acc = trajectory.sample(t_local[chunk])
+
+                # Step the vehicle, keeping the position at the start of every step for the search
+                start = [self.vehicle.pos.x, self.vehicle.pos.y]
+                if self.integrator is IntegratorEnum.VECTORIZED:
+                    pos, _, _ = self.vehicle.integrate(des_acc)
+                    xy = np.vstack(([start], pos))
+                else:
+                    xy = np.zeros((len(chunk)+1, 2))
+                    for k, des in enumerate(zip(des_pos.tolist(), des_vel.tolist(), des_acc.tolist())):
+                        xy[k] = self.vehicle.pos.x, self.vehicle.pos.y
+                        self.vehicle.step(*des)
+                    xy[-1] = self.vehicle.pos.x, self.vehicle.pos.y
+
+                yield t_global[chunk[0]:chunk[-1]+2], xy
+            t = t_global[-1]
+
+    def _cache_path(self) -> str:
+        # Content address of the flown path, everything that changes the integration goes into the key
+        if self.trajectory_cache is None:
+            return None
+        key = hashlib.sha1(np.array([self.waypoints.x, self.waypoints.y], dtype=float).tobytes())
+        key.update(f"{self.mean_flight_speed!r},{self.dt!r},{self.integrator},{chunk_size},accumulated".encode())
+        return os.path.join(self.trajectory_cache, f"trajectory_{key.hexdigest()}.npz")
+
+    def _path(self):
+        """`_fly` backed by the trajectory cache.
+
+        A cached path is replayed in chunks of the same layout as `_fly` and the vehicle's data and
+        final state are restored without integrating. Otherwise the path is flown and stored.
+        """
+        path = self._cache_path()
+        if path is not None and os.path.exists(path):
+            logger.trace(f"{self.alg} - Replaying trajectory from {path}", enqueue=True)
+            with np.load(path) as f:
+                t, xy, state = f['t'], f['xy'], f['state']
+                self.vehicle.data = VehicleSimData.fromArrays(f['data_t'], f['data_pos'], f['data_dpos'], f['data_ddpos'], maxlen=self.vehicle.data.maxlen)
+            self.vehicle.pos, self.vehicle.dpos, self.vehicle.ddpos = Pose(*state[0:2]), Pose(*state[2:4]), Pose(*state[4:6])
+            self.vehicle.t, self.vehicle.c = float(state[6]), int(state[7])
+            for k in range(0, len(t)-1, chunk_size):
+                yield t[k:k+chunk_size+1], xy[k:k+chunk_size+1]
+            return
+
+        # A bounded history can't be cached
+        if self.vehicle.data.maxlen is not None:
+            path = None
+        t_all, xy_all = [], []
+        end = np.array([self.vehicle.t]), np.array([[self.vehicle.pos.x, self.vehicle.pos.y]])
+        for t, xy in self._fly():
+            if path is not None:
+                t_all.append(t[:-1])
+                xy_all.append(xy[:-1])
+                end = t[-1:], xy[-1:]
+            yield t, xy
+
+        if path is not None:
+            vehicle = self.vehicle
+            state = [vehicle.pos.x, vehicle.pos.y, vehicle.dpos.x, vehicle.dpos.y, vehicle.ddpos.x, vehicle.ddpos.y, vehicle.t, vehicle.c]
+            # Write to a temporary file first so concurrent runs never read a partial cache entry
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                np.savez(f, t=np.concatenate(t_all+[end[0]]), xy=np.concatenate(xy_all+[end[1]]), state=np.array(state, dtype=float),
+                         data_t=vehicle.data.t, data_pos=vehicle.data.pos.toNumpyArray(), data_dpos=vehicle.data.dpos.toNumpyArray(), data_ddpos=vehicle.data.ddpos.toNumpyArray())
+            os.replace(tmp, path)
+            logger.trace(f"{self.alg} - Trajectory cached to {path}", enqueue=True)
+
+    def flown(self):
+        """Fly the path as chunks of (t, xy) like `_fly`, cut short by the time budget and the endurance.
+
+        Every search of the simulation runs on this path, searches outside of it should too. The chunk
+        that exceeds a budget is cut after its last vertex within the budget and the run stops there,
+        with the vehicle's samples truncated and the stop reason recorded. In sampled mode the next
+        vertex is kept as well since the sampled search ignores a chunk's last vertex.
+        """
+        distance = 0.0
+        for t, xy in self._path():
+            if self.renderer is not None:
+                self.renderer.update(self.vehicle.data)
+            keep, reason = len(t), None
+            if self.max_time is not None and t[-1] > self.max_time:
+                keep, reason = np.searchsorted(t, self.max_time, side='right'), StopReasonEnum.TIME_BUDGET
+            if self.endurance is not None:
+                travelled = distance+np.concatenate(([0], np.cumsum(np.linalg.norm(np.diff(xy, axis=0), axis=1))))
+                distance = travelled[-1]
+                if np.searchsorted(travelled, self.endurance, side='right') < keep:
+                    keep, reason = np.searchsorted(travelled, self.endurance, side='right'), StopReasonEnum.ENDURANCE
+
+            if reason is None:
+                self.t_end = t[-1]
+                yield t, xy
+                continue
+
+            keep = max(int(keep), 1)
+            self._stop(reason, t[keep-1])
+            end = keep+1 if self.detection is DetectionModeEnum.SAMPLED else keep
+            yield t[:end], xy[:end]
+            return
+        self.vehicle.data.stop_reason = StopReasonEnum.COMPLETED
+
+    def _stop(self, reason: StopReasonEnum, t: float) -> None:
+        self.t_end = t
+        self.vehicle.data.truncate(t)
+        self.vehicle.data.stop_reason = reason
+        logger.info(f"{self.alg} - Stopped at t={t:.2f}s ({reason})", enqueue=True)
+
+    def _until_target(self, ledger: DetectionLedger, inds: np.ndarray, t_found: np.ndarray) -> Tuple[np.ndarray, np.ndarray, float]:
+        # Drop the chunk's detections after the target found fraction is reached, returns the time it was reached
+        if self.target_found_fraction is None or len(inds) == 0:
+            return inds, t_found, None
+        order = np.argsort(t_found, kind='stable')
+        found = np.sum(self.object_counts[ledger.found])+np.cumsum(self.object_counts[inds[order]])
+        reached = found >= self.target_found_fraction*self.num_objs-1e-9
+        if not np.any(reached):
+            return inds, t_found, None
+        t_stop = t_found[order[np.argmax(reached)]]
+        keep = t_found <= t_stop
+        return inds[keep], t_found[keep], t_stop
+
+    def fly(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Fly the whole path without searching.
+
+        Returns the times and positions at the start of every step followed by the final
+        position, as (N+1,) and (N+1, 2) arrays.
+        """
+        t, xy = [], []
+        end = np.array([self.vehicle.t]), np.array([[self.vehicle.pos.x, self.vehicle.pos.y]])
+        for times, pos in self.flown():
+            t.append(times[:-1])
+            xy.append(pos[:-1])
+            end = times[-1:], pos[-1:]
+        return np.concatenate(t+[end[0]]), np.concatenate(xy+[end[1]])
+
+    def detect(self, index: GridIndex, t: np.ndarray, xy: np.ndarray, found: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Search the flown path (t, xy) from `fly` for the points in `index` with this simulation's detection mode.
+
+        Returns the indices of the newly detected points and their detection times.
+        """
+        # t and xy hold one more vertex than there are steps, the sampled search ignores it
+        if self.detection is DetectionModeEnum.SWEPT:
+            return first_detection_swept(index, t, xy, self.search_radius, found)
+        return first_detection_sampled(index, t[:-1], xy[:-1], self.search_radius, found)
+
+    def run(self) -> VehicleSimData:
+        if self.coverage_shape is not None:
+            return self._run_coverage()
+        objs_possible_xy = self._candidates()
+
+        index = GridIndex(objs_possible_xy, max(self.search_radius, 1.0))
+        ledger = DetectionLedger(len(objs_possible_xy), path=self.ledger_path)
+        if self.ledger_path is not None:
+            logger.trace(f"{self.alg} - Detection ledger spilled to {self.ledger_path}",enqueue=True)
+
+        for t, xy in self.flown():
+            # Search for objects
+            inds, t_found = self.detect(index, t, xy, ledger.found)
+            inds, t_found, t_stop = self._until_target(ledger, inds, t_found)
+            ledger.record(inds, t_found)
+            if self.renderer is not None:
+                self.renderer.set_found(objs_possible_xy[ledger.found])
+            if t_stop is not None:
+                self._stop(StopReasonEnum.ALL_FOUND if np.all(ledger.found) else StopReasonEnum.FOUND_FRACTION, t_stop)
+                break
+
+        return self._collect(ledger, objs_possible_xy)
+
+    def iter_events(self, snapshot_every: float = None, history: int = 1):
+        """Run the simulation as a generator of `SimEvent`s.
+
+        Detections are yielded in time order as soon as their chunk is searched, a SNAPSHOT of the
+        vehicle position follows the first chunk ending at least `snapshot_every` seconds after the
+        previous one and a STOP event ends the stream. Detections are not buffered in
+        `vehicle.data.found` and only the latest `history` vehicle samples are kept in `vehicle.data`
+        unless animating, so memory stays bounded however long the flight. The stop conditions of
+        `run` apply and the flown path is not written to the trajectory cache.
+        """
+        if self.renderer is None:
+            self.vehicle.data.maxlen = history
+        objs_possible_xy = self._candidates()
+        index = GridIndex(objs_possible_xy, max(self.search_radius, 1.0))
+        ledger = DetectionLedger(len(objs_possible_xy), path=self.ledger_path)
+        found = 0
+        next_snapshot = np.inf if snapshot_every is None else snapshot_every
+
+        try:
+            for t, xy in self.flown():
+                inds, t_found = self.detect(index, t, xy, ledger.found)
+                inds, t_found, t_stop = self._until_target(ledger, inds, t_found)
+                ledger.record(inds, t_found)
+                for i in np.argsort(t_found, kind='stable'):
+                    found += self.object_counts[inds[i]]
+                    yield SimEvent(SimEventEnum.DETECTION, t_found[i], found/max(self.num_objs,1), location=self.searched_object_locations[inds[i]], count=int(self.object_counts[inds[i]]))
+
+                if t_stop is not None:
+                    self._stop(StopReasonEnum.ALL_FOUND if np.all(ledger.found) else StopReasonEnum.FOUND_FRACTION, t_stop)
+                    break
+                if t[-1] >= next_snapshot:
+                    next_snapshot = t[-1]+snapshot_every
+                    yield SimEvent(SimEventEnum.SNAPSHOT, t[-1], found/max(self.num_objs,1), location=xy[-1])
+
+            yield SimEvent(SimEventEnum.STOP, self.t_end, found/max(self.num_objs,1), stop_reason=self.vehicle.data.stop_reason)
+        finally:
+            ledger.close()
+
+    def paint_coverage(self) -> CoverageRaster:
+        """Fly the whole path and paint the time of first coverage of every cell of `coverage_shape`."""
+        raster = CoverageRaster(self.coverage_shape, self.search_radius, self.detection)
+        for t, xy in self.flown():
+            raster.paint(t, xy)
+        self.vehicle.data.coverage = raster.times
+        logger.trace(f"{self.alg} - Covered {100*np.mean(raster.covered):.2f}% of the {raster.shape} raster", enqueue=True)
+        return raster
+
+    def _run_coverage(self) -> VehicleSimData:
+        # Detect every object by looking up its cell in the painted raster
+        t_found = self.paint_coverage().lookup(self.searched_object_locations)
+        ledger = DetectionLedger(len(t_found))
+        inds = np.where(~np.isnan(t_found))[0]
+        inds, t_found, t_stop = self._until_target(ledger, inds, t_found[inds])
+        ledger.record(inds, t_found)
+        if t_stop is not None:
+            # The whole path is painted up front, forget the cells first covered after the stop
+            self.vehicle.data.coverage[self.vehicle.data.coverage > t_stop] = np.nan
+            self._stop(StopReasonEnum.ALL_FOUND if np.all(ledger.found) else StopReasonEnum.FOUND_FRACTION, t_stop)
+        return self._collect(ledger, self.searched_object_locations)
+
+    def _collect(self, ledger: DetectionLedger, objs_possible_xy: np.ndarray) -> VehicleSimData:
+        inds, t_found = ledger.detections(objs_possible_xy, self.searched_object_locations)
+        # Expand the found cells back to one entry per object
+        counts = self.object_counts[inds]
+        self.vehicle.data.found.extend(zip(np.repeat(t_found, counts).tolist(), np.repeat(self.searched_object_locations[inds], counts, axis=0)))
+        ledger.close()
 
         logger.info(
-            f"{self.alg} - Found {100*len(self.vehicle.data.found)/self.num_objs:.2f}% ({len(self.vehicle.data.found)}/{self.num_objs}) objects", enqueue=True)
+            f"{self.alg} - Found {100*len(self.vehicle.data.found)/max(self.num_objs,1):.2f}% ({len(self.vehicle.data.found)}/{self.num_objs}) objects", enqueue=True)
 
-        if self.animate:
-            self._plot()
-            plt.show(block=True)
+        if self.renderer is not None:
+            self.renderer.set_found(self.searched_object_locations[inds])
+            self.renderer.show(self.vehicle.data)
 
         return self.vehicle.data
-    
-    def _plot(self) -> None:
-
-        wps_x = self.waypoints.x
-        wps_y = self.waypoints.y
-
-        fig = self._ax_pos
-        fig.cla()
-        fig.set_aspect('equal',adjustable='datalim')
-        fig.scatter(wps_x,wps_y,c='g',s=2)
-        fig.add_artist(plt.Circle((self.vehicle.pos.x, self.vehicle.pos.y), size, color='r'))
-        fig.plot(self.vehicle.data.pos.x, self.vehicle.data.pos.y, 'b:')      
-
-        fig.quiver(self.vehicle.pos.x, self.vehicle.pos.y,np.clip(0.01,np.inf,self.vehicle.dpos.x), np.clip(0.001,np.inf,self.vehicle.dpos.y))
-        
-        fig.set_ylabel("y ($m$)")
-        fig.set_xlabel("x ($m$)")
-        fig.text(0.1,0.9,f"t=${self.vehicle.t:.2f}s$",ha='center', va='center', transform=fig.transAxes) 
-        
-        fig = self._ax_xy
-        fig.cla()
-        fig.set_ylabel("position ($m$)")
-        fig.set_xlabel("$t$ ($s$)")
-        x = np.array(self.vehicle.data.pos.x)
-        y = np.array(self.vehicle.data.pos.y)
-        fig.plot(self.vehicle.data.t,x,label=r'$\vec p_x$')
-        fig.plot(self.vehicle.data.t,y,label=r'$\vec p_y$')
-        fig.legend()
-        
-        fig = self._ax_dxy
-        fig.cla()
-        fig.set_ylabel("speed ($ms^{-1}$)")
-        fig.set_xlabel("$t$ ($s$)")
-        x = np.array(self.vehicle.data.dpos.x)
-        y = np.array(self.vehicle.data.dpos.y)
-        mag = np.linalg.norm([x,y],axis=0)
-        fig.plot(self.vehicle.data.t,x,label=r'$\dot \vec p_x$')
-        fig.plot(self.vehicle.data.t,y,label=r'$\dot \vec p_y$')
-        fig.plot(self.vehicle.data.t,mag,label=r'$|\dot \vec p|$')
-        fig.legend()
-
-        fig = self._ax_ddxy
-        fig.cla()
-        fig.set_ylabel("acceleration ($m^2 s^{-1}$)")
-        fig.set_xlabel("$t$ ($s$)")
-        x = np.array(self.vehicle.data.ddpos.x)
-        y = np.array(self.vehicle.data.ddpos.y)
-        mag = np.linalg.norm([x,y],axis=0)
-        fig.plot(self.vehicle.data.t,x,label=r'$\ddot \vec p_x$')
-        fig.plot(self.vehicle.data.t,y,label=r'$\ddot \vec p_y$')
-        fig.plot(self.vehicle.data.t,mag,label=r'$|\ddot \vec p|$')
-        fig.legend()
-
-        plt.pause(0.0001)
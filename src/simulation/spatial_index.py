@@ -0,0 +1,50 @@
+import numpy as np
+
+class GridIndex:
+    """Uniform grid hash over a fixed set of 2D points.
+
+    Points are bucketed into square cells of side `cell_size` and stored sorted by cell in row
+    major order, so every row of cells maps to one contiguous slice of `order`.
+    """
+    def __init__(self, points: np.ndarray, cell_size: float) -> None:
+        self.points = np.asarray(points, dtype=float).reshape(-1, 2)
+        self.cell_size = float(cell_size)
+
+        if len(self.points) == 0:
+            self.origin = np.zeros(2)
+            self.shape = (0, 0)
+            self.order = np.zeros(0, dtype=int)
+            self.offsets = np.zeros(1, dtype=int)
+            return
+
+        self.origin = np.min(self.points, axis=0)
+        cells = np.floor((self.points-self.origin)/self.cell_size).astype(int)
+        nx, ny = np.max(cells, axis=0)+1
+        self.shape = (int(nx), int(ny))
+
+        cell_ids = cells[:,1]*nx + cells[:,0]
+        self.order = np.argsort(cell_ids, kind='stable')
+        self.offsets = np.searchsorted(cell_ids[self.order], np.arange(nx*ny+1))
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def query(self, lower, upper) -> np.ndarray:
+        """Indices of all points in the cells overlapping the box [lower, upper].
+
+        This is a superset of the points inside the box, callers filter on exact distance.
+        """
+        nx, ny = self.shape
+        x0, y0 = np.floor((np.asarray(lower)-self.origin)/self.cell_size).astype(int)
+        x1, y1 = np.floor((np.asarray(upper)-self.origin)/self.cell_size).astype(int)
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, nx-1), min(y1, ny-1)
+        if x0 > x1 or y0 > y1:
+            return np.zeros(0, dtype=int)
+
+        slices = [self.order[self.offsets[row*nx+x0]:self.offsets[row*nx+x1+1]] for row in range(y0, y1+1)]
+        return np.concatenate(slices)
+
+    def query_radius(self, center, radius: float) -> np.ndarray:
+        center = np.asarray(center, dtype=float)
+        return self.query(center-radius, center+radius)
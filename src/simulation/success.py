@@ -0,0 +1,44 @@
+import numpy as np
+from loguru import logger
+from src.data_models.probability_map import ProbabilityMap
+from src.simulation.simulation import Simulation
+from src.simulation.vehicle import VehicleSimData
+
+class SuccessCurve:
+    """Cumulative probability of success of a flown path over time.
+
+    `p[i]` is the probability mass of the map covered by the sensor up to and including time `t[i]`,
+    i.e. the expected fraction of objects placed on the map that are found by then.
+    """
+    def __init__(self, t: list = [], p: list = [], vehicle_data: VehicleSimData = None) -> None:
+        self.t = np.asarray(t, dtype=float)
+        self.p = np.asarray(p, dtype=float)
+        self.vehicle_data = vehicle_data
+
+    @property
+    def total(self) -> float:
+        return float(self.p[-1]) if len(self.p) > 0 else 0.0
+
+    def at(self, t) -> np.ndarray:
+        """Probability of success at the times `t`."""
+        i = np.searchsorted(self.t, t, side='right')
+        return np.concatenate(([0.0], self.p))[i]
+
+    def __str__(self) -> str:
+        return f"SuccessCurve({100*self.total:.2f}% after {self.t[-1] if len(self.t) > 0 else 0:.2f}s)"
+
+def probability_of_success(simulation: Simulation, prob_map: ProbabilityMap) -> SuccessCurve:
+    """Fly the simulation's path once and integrate `prob_map` over the time each cell is first covered.
+
+    The result is the expected found fraction of objects placed with `ProbabilityMap.place` as a
+    function of time, computed without placing any. The simulation's objects are ignored.
+    """
+    simulation.coverage_shape = prob_map.shape
+    times = simulation.paint_coverage().times
+    covered = ~np.isnan(times)
+
+    t, inverse = np.unique(times[covered], return_inverse=True)
+    mass = np.bincount(inverse.reshape(-1), weights=prob_map.prob_map[covered], minlength=len(t))
+    curve = SuccessCurve(t, np.cumsum(mass)/np.sum(prob_map.prob_map), simulation.vehicle.data)
+    logger.info(f"{simulation.alg} - {curve}", enqueue=True)
+    return curve
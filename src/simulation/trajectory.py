@@ -4,20 +4,116 @@ from src.data_models.positional.waypoint import Waypoint, Waypoints
 from src.data_models.positional.pose import Pose
 from src.data_models.abstractListObject import AbstractListObject
 
-from typing import List, Type, TypeVar, Tuple
+from typing import List, TypeVar, Tuple
 
 T = TypeVar('T', bound='Trajectories')
 U = TypeVar('U', bound='Trajectory')
 class Trajectories(AbstractListObject):
     def __init__(self, trajs:List[U] = []):
         super().__init__(trajs)
+        self._coeffs = None
+
+    @classmethod
+    def from_waypoints(cls, waypoints: Waypoints, mean_flight_speed: float) -> T:
+        """Build the quintic segments between consecutive waypoints in one batched solve.
+
+        The vehicle stops at the first and last waypoint. At every intermediate waypoint B
+        (between A and C) it passes with velocity along AC scaled by chi = ((1-cos(ABC))/2)^3,
+        so straight passes are flown at `mean_flight_speed` and hairpins come to a halt.
+        """
+        wps = np.column_stack((waypoints.x, waypoints.y)).astype(float)
+
+        vel = np.zeros(wps.shape)
+        a, b, c = wps[:-2], wps[1:-1], wps[2:]
+        rAC = c-a
+        rBA = a-b
+        rBC = c-b
+        rAC_unit = rAC/np.clip(np.linalg.norm(rAC,axis=1),1e-6,np.inf)[:,None]
+        theta = np.sum(rBA*rBC,axis=1)/(np.linalg.norm(rBA,axis=1)*np.linalg.norm(rBC,axis=1))
+        chi = np.power((1-theta)/2,3)
+        vel[1:-1] = mean_flight_speed*rAC_unit*chi[:,None]
+
+        durations = np.linalg.norm(wps[1:]-wps[:-1],axis=1)/mean_flight_speed
+        coeffs = cls.solve(durations, wps[:-1], wps[1:], vel[:-1], vel[1:])
+
+        trajs = cls([Trajectory(start_pos=waypoints[i], dest_pos=waypoints[i+1], T=durations[i],
+                                start_vel=Pose(vel[i]), dest_vel=Pose(vel[i+1]), coeffs=coeffs[i])
+                     for i in range(len(durations))])
+        trajs._coeffs = coeffs
+        return trajs
+
+    @staticmethod
+    def solve(T, start_pos, dest_pos, start_vel, dest_vel, start_acc=None, dest_acc=None) -> np.ndarray:
+        """Solve the boundary value problem of every segment in a single stacked `np.linalg.solve`.
+
+        All arguments are per segment, i.e. T is (segments,) and the rest are (segments, 2).
+        Accelerations default to zero. Returns coefficients as (segments, 2, 6) from t**5 down to t**0.
+        """
+        T = np.atleast_1d(np.asarray(T, dtype=float))
+        zeros = np.zeros((len(T), 2))
+        start_acc = zeros if start_acc is None else start_acc
+        dest_acc = zeros if dest_acc is None else dest_acc
+
+        one, zero = np.ones(len(T)), np.zeros(len(T))
+        A = np.stack([
+            np.stack([zero, zero, zero, zero, zero, one],axis=1), # f(t=0)
+            np.stack([T**5, T**4, T**3, T**2, T, one],axis=1), # f(t=T)
+            np.stack([zero, zero, zero, zero, one, zero],axis=1), # f'(t=0)
+            np.stack([5*T**4, 4*T**3, 3*T**2, 2*T, one, zero],axis=1), # f'(t=T)
+            np.stack([zero, zero, zero, 2*one, zero, zero],axis=1), # f''(t=0)
+            np.stack([20*T**3, 12*T**2, 6*T, 2*one, zero, zero],axis=1) # f''(t=T)
+        ],axis=1)
+        b = np.stack([start_pos, dest_pos, start_vel, dest_vel, start_acc, dest_acc],axis=1).astype(float)
+
+        return np.swapaxes(np.linalg.solve(A, b), 1, 2)
+
+    def add(self, item: U) -> None:
+        super().add(item)
+        self._coeffs = None
+
+    @property
+    def T(self) -> np.ndarray:
+        return np.array([f.T for f in self.items], dtype=float)
+
+    @property
+    def coeff_array(self) -> np.ndarray:
+        if self._coeffs is None:
+            self._coeffs = np.array([f.coeff_array for f in self.items]).reshape(-1, 2, 6)
+        return self._coeffs
+
+    def sample(self, t) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Evaluate the piecewise trajectory at the global times `t`.
+
+        Segments are laid end to end, so segment i covers [sum(T[:i]), sum(T[:i+1])].
+        Times past the last segment are evaluated on the last segment.
+
+        Returns position, velocity and acceleration as (len(t), 2) arrays.
+        """
+        t = np.atleast_1d(np.asarray(t, dtype=float))
+        starts = np.concatenate(([0], np.cumsum(self.T)[:-1]))
+        inds = np.clip(np.searchsorted(starts, t, side='right')-1, 0, len(starts)-1)
+        return _horner(self.coeff_array[inds], t-starts[inds])
+
+def _horner(coeffs: np.ndarray, t: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # coeffs is (2, 6) or (len(t), 2, 6) ordered from t**5 down to t**0
+    t = t[:, None]
+    pos = np.zeros((len(t), 2))
+    vel = np.zeros((len(t), 2))
+    acc = np.zeros((len(t), 2))
+    for k in range(6):
+        pos = pos*t + coeffs[..., k]
+    for k in range(5):
+        vel = vel*t + (5-k)*coeffs[..., k]
+    for k in range(4):
+        acc = acc*t + (5-k)*(4-k)*coeffs[..., k]
+    return pos, vel, acc
 
 def _type_check(var, expected):
         if not isinstance(var, expected): 
             raise TypeError(f"Type {expected} expected. {type(var)} received")
 
 class Trajectory:
-    def __init__(self, start_pos: Waypoint=Waypoint.zero(), dest_pos: Waypoint=Waypoint.zero(), T: float=5, start_vel:Pose=Pose.zero(), dest_vel:Pose=Pose.zero(), start_acc:Pose=Pose.zero(), dest_acc:Pose=Pose.zero()):
+    def __init__(self, start_pos: Waypoint=Waypoint.zero(), dest_pos: Waypoint=Waypoint.zero(), T: float=5, start_vel:Pose=Pose.zero(), dest_vel:Pose=Pose.zero(), start_acc:Pose=Pose.zero(), dest_acc:Pose=Pose.zero(), coeffs: np.ndarray=None):
         _type_check(start_pos, Waypoint)
         _type_check(dest_pos, Waypoint)
         _type_check(start_vel, Pose)
@@ -36,37 +132,37 @@ class Trajectory:
 
         self.T = T
 
-        self.solve()
+        if coeffs is None:
+            self.solve()
+        else:
+            self.coeffs = {'x':np.reshape(coeffs[0],(6,1)),'y':np.reshape(coeffs[1],(6,1))}
 
     def solve(self) -> None:
-        A = np.array(
-            [[0, 0, 0, 0, 0, 1], # f(t=0)
-             [self.T**5, self.T**4, self.T**3, self.T**2, self.T, 1], # f(t=T)
-             [0, 0, 0, 0, 1, 0], # f'(t=0)
-             [5*self.T**4, 4*self.T**3, 3*self.T**2, 2*self.T, 1, 0], # f'(t=T)
-             [0, 0, 0, 2, 0, 0], # f''(t=0)
-             [20*self.T**3, 12*self.T**2, 6*self.T, 2, 0, 0] # f''(t=T)
-            ])
-
-        b_x = np.array(
-            [[self.start_pos.x],
-             [self.dest_pos.x],
-             [self.start_vel.x],
-             [self.dest_vel.x],
-             [self.start_acc.x],
-             [self.dest_acc.x]
-            ])
-
-        b_y = np.array(
-            [[self.start_pos.y],
-             [self.dest_pos.y],
-             [self.start_vel.y],
-             [self.dest_vel.y],
-             [self.start_acc.y],
-             [self.dest_acc.y]
-            ])
-        
-        self.coeffs = {'x':np.linalg.solve(A, b_x),'y':np.linalg.solve(A, b_y)}
+        coeffs = Trajectories.solve(self.T,
+                                    [list(self.start_pos)],
+                                    [list(self.dest_pos)],
+                                    [list(self.start_vel)],
+                                    [list(self.dest_vel)],
+                                    [list(self.start_acc)],
+                                    [list(self.dest_acc)])[0]
+        self.coeffs = {'x':coeffs[0][:,None],'y':coeffs[1][:,None]}
+
+    @property
+    def coeff_array(self) -> np.ndarray:
+        return np.hstack((self.coeffs['x'], self.coeffs['y'])).T
+
+    def sample_times(self, dt: float) -> np.ndarray:
+        """The times in [0, T] the segment is flown at, accumulated like a `t += dt` loop so the step count matches it."""
+        t = np.add.accumulate(np.concatenate(([0.0], np.full(int(self.T/dt)+2, dt))))
+        return t[t <= self.T]
+
+    def sample(self, t) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Evaluate the polynomial at every time in `t` using Horner's scheme.
+
+        Returns position, velocity and acceleration as (len(t), 2) arrays.
+        """
+        t = np.atleast_1d(np.asarray(t, dtype=float))
+        return _horner(self.coeff_array, t)
     
     def __getitem__(self,key: int) -> Tuple[float]:
         if key<len(self.x):
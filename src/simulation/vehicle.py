@@ -1,16 +1,16 @@
 import numpy as np
-import copy
 from src.simulation.parameters import *
-from src.data_models.positional.pose import Pose, Poses
+from src.data_models.positional.pose import Pose, PoseArray
 from src.data_models.positional.angle import Yaw
 
 class Vehicle:
-    def __init__(self, pos=Pose.zero(), dpos=Pose.zero(), ddpos=Pose.zero(), des_yaw:float=0):
-        self.pos = pos
-        self.dpos = dpos
-        self.ddpos = ddpos
+    def __init__(self, pos:Pose=None, dpos:Pose=None, ddpos:Pose=None, des_yaw:float=0, dt:float=dt):
+        self.pos = Pose.zero() if pos is None else pos
+        self.dpos = Pose.zero() if dpos is None else dpos
+        self.ddpos = Pose.zero() if ddpos is None else ddpos
         self.t = 0
         self.c = -1
+        self.dt = dt
 
         self.data = VehicleSimData()
 
@@ -38,34 +38,140 @@ class Vehicle:
         self.ddpos.y = (T_y-F_Dy)/m
 
         ## Euler integration
-        self.dpos.x += self.ddpos.x * dt
-        self.dpos.y += self.ddpos.y * dt
-        self.pos.x += self.dpos.x * dt
-        self.pos.y += self.dpos.y * dt
+        self.dpos.x += self.ddpos.x * self.dt
+        self.dpos.y += self.ddpos.y * self.dt
+        self.pos.x += self.dpos.x * self.dt
+        self.pos.y += self.dpos.y * self.dt
         
-        if self.c%int(0.5/dt) == 0:
+        if self.c%max(int(0.5/self.dt),1) == 0:
             self._store()
         self.c+=1
 
-        self.t += dt
+        self.t += self.dt
+
+    def integrate(self, des_acc: np.ndarray):
+        """Vectorised equivalent of calling `step` once per row of the (n, 2) array `des_acc`.
+
+        The controller's thrust cancels the drag exactly, so the vehicle accelerates as desired
+        and the explicit Euler updates reduce to cumulative sums. Samples are stored on the same
+        steps as `step` would store them. Returns the position, velocity and acceleration after
+        every step as (n, 2) arrays.
+        """
+        des_acc = np.asarray(des_acc, dtype=float).reshape(-1,2)
+        n = len(des_acc)
+        if n == 0:
+            return np.zeros((0,2)), np.zeros((0,2)), np.zeros((0,2))
+
+        ddpos = des_acc
+        dpos = np.array([self.dpos.x, self.dpos.y]) + np.cumsum(ddpos*self.dt, axis=0)
+        pos = np.array([self.pos.x, self.pos.y]) + np.cumsum(dpos*self.dt, axis=0)
+
+        steps = np.arange(n)
+        stored = (self.c+steps) % max(int(0.5/self.dt),1) == 0
+        self.data.extend(self.t+steps[stored]*self.dt, pos[stored], dpos[stored], ddpos[stored])
+
+        self.pos.x, self.pos.y = pos[-1]
+        self.dpos.x, self.dpos.y = dpos[-1]
+        self.ddpos.x, self.ddpos.y = ddpos[-1]
+        self.c += n
+        self.t += n*self.dt
+
+        return pos, dpos, ddpos
 
     def _store(self) -> None:
         self.data.update(self.t, self.pos, self.dpos, self.ddpos)
 
 class VehicleSimData:
-    def __init__(self) -> None:
-        self.t = []
+    """Sampled state history of a vehicle.
+
+    Samples are stored column wise in preallocated arrays that double in size when full, `t` is
+    (N,) and `pos`, `dpos` and `ddpos` are (N, 2). The accessors return views of the filled part.
+    With a `maxlen` only the latest `maxlen` samples are kept and the arrays never grow past
+    twice that.
+    """
+    def __init__(self, capacity: int = 64, maxlen: int = None) -> None:
         self.found = []
-        self.pos = Poses() 
-        self.dpos = Poses()
-        self.ddpos = Poses()
+        self.coverage = None
+        self.stop_reason = None
+        self.maxlen = maxlen
+        self._n = 0
+        self._t = np.zeros(capacity)
+        self._pos = np.zeros((capacity,2))
+        self._dpos = np.zeros((capacity,2))
+        self._ddpos = np.zeros((capacity,2))
+
+    @classmethod
+    def fromArrays(cls, t, pos, dpos, ddpos, found: list = [], maxlen: int = None) -> 'VehicleSimData':
+        data = cls(capacity=max(len(t) if maxlen is None else min(len(t), maxlen),1), maxlen=maxlen)
+        data.extend(t, pos, dpos, ddpos)
+        data.found = list(found)
+        return data
+
+    @property
+    def _start(self) -> int:
+        return 0 if self.maxlen is None else max(self._n-self.maxlen, 0)
+
+    @property
+    def t(self) -> np.ndarray:
+        return self._t[self._start:self._n]
+    @property
+    def pos(self) -> PoseArray:
+        return PoseArray(self._pos[self._start:self._n])
+    @property
+    def dpos(self) -> PoseArray:
+        return PoseArray(self._dpos[self._start:self._n])
+    @property
+    def ddpos(self) -> PoseArray:
+        return PoseArray(self._ddpos[self._start:self._n])
+
+    def __len__(self) -> int:
+        return self._n-self._start
+
+    def _reserve(self, n: int) -> None:
+        if self.maxlen is not None and n > 2*self.maxlen:
+            # Move the samples still in the window to the front instead of growing
+            added = n-self._n
+            keep = min(max(self.maxlen-added, 0), self._n)
+            for name in ('_t','_pos','_dpos','_ddpos'):
+                arr = getattr(self, name)
+                arr[:keep] = arr[self._n-keep:self._n]
+            self._n = keep
+            n = keep+added
+        capacity = len(self._t)
+        if n <= capacity:
+            return
+        while capacity < n:
+            capacity *= 2
+        if self.maxlen is not None:
+            capacity = max(min(capacity, 2*self.maxlen), n)
+        for name in ('_t','_pos','_dpos','_ddpos'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,*old.shape[1:]))
+            new[:self._n] = old[:self._n]
+            setattr(self, name, new)
 
     def update(self, t, pos, dpos, ddpos):
-        self.t.append(t)
-        self.pos.add(copy.deepcopy(pos))
-        self.dpos.add(copy.deepcopy(dpos))
-        self.ddpos.add(copy.deepcopy(ddpos))
+        self._reserve(self._n+1)
+        self._t[self._n] = t
+        self._pos[self._n] = pos[0], pos[1]
+        self._dpos[self._n] = dpos[0], dpos[1]
+        self._ddpos[self._n] = ddpos[0], ddpos[1]
+        self._n += 1
+
+    def extend(self, t, pos, dpos, ddpos):
+        if self.maxlen is not None and len(t) > self.maxlen:
+            t, pos, dpos, ddpos = t[-self.maxlen:], pos[-self.maxlen:], dpos[-self.maxlen:], ddpos[-self.maxlen:]
+        n = len(t)
+        self._reserve(self._n+n)
+        self._t[self._n:self._n+n] = t
+        self._pos[self._n:self._n+n] = pos
+        self._dpos[self._n:self._n+n] = dpos
+        self._ddpos[self._n:self._n+n] = ddpos
+        self._n += n
 
+    def truncate(self, t: float) -> None:
+        """Drop every sample after time `t`."""
+        self._n = self._start+int(np.searchsorted(self.t, t, side='right'))
 
     def __str__(self) -> str:
-        return f"VehicleSimData({self.__dict__})"
\ No newline at end of file
+        return f"VehicleSimData(found={self.found}, t={self.t}, pos={self.pos}, dpos={self.dpos}, ddpos={self.ddpos})"
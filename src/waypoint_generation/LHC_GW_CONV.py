@@ -3,11 +3,15 @@ from src.data_models.probability_map import ProbabilityMap
 from src.data_models.positional.waypoint import Waypoint,Waypoints
 from src.waypoint_generation.waypoint_settings import WaypointAlgSettings
 from src.simulation.parameters import *
+from src.shared_memory_helper import SharedArray
+from src.enums import LSearchEnum
 
 import matplotlib.pyplot as plt
 import numpy as np
 import time
-import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
 from enum import IntEnum
 
 from typing import List
@@ -39,6 +43,89 @@ class ConvolutionResult:
         elif key == 2: return self.n
         else :         raise IndexError(f"{key} > 2")
 
+GOLDEN_RATIO = (1+5**0.5)/2
+
+NEIGHBOUR_OFFSETS = np.array([
+    (-1, -1),
+    (1, -1),
+    ( 0,-1),
+    (-1,1),
+    (1,1),
+    ( 0, 1),
+    (-1, 0),
+    ( 1, 0),
+])
+
+class VisitedGrid:
+    """Cells visited by a walk over a probability map, held as a boolean grid.
+
+    A waypoint is looked up by its floored (x, y), so membership checks are O(1) instead of a scan
+    of the path. Waypoints off the grid are never visited. The path itself is kept in order for plotting.
+    """
+    def __init__(self, prob_map: ProbabilityMap):
+        # Walks are bounded by x <= shape[0]-0.5 and y <= shape[1]-0.5, see `LHC_GW_CONV.neighbours`
+        self.grid = np.zeros(prob_map.shape[:2], dtype=bool)
+        self.path = []
+
+    def _cell(self, pos: Waypoint):
+        i, j = int(np.floor(pos.x)), int(np.floor(pos.y))
+        if 0 <= i < self.grid.shape[0] and 0 <= j < self.grid.shape[1]:
+            return i, j
+        return None
+
+    def add(self, pos: Waypoint) -> None:
+        cell = self._cell(pos)
+        if cell is not None:
+            self.grid[cell] = True
+        self.path.append(pos)
+
+    def contains(self, xy: np.ndarray) -> np.ndarray:
+        """Vectorised `in` for an array of (x, y) positions along its last axis."""
+        cells = np.floor(xy).astype(int)
+        on_grid = (cells[...,0] >= 0) & (cells[...,0] < self.grid.shape[0]) & (cells[...,1] >= 0) & (cells[...,1] < self.grid.shape[1])
+        ret = np.zeros(on_grid.shape, dtype=bool)
+        ret[on_grid] = self.grid[cells[...,0][on_grid], cells[...,1][on_grid]]
+        return ret
+
+    def reachable(self, pos: Waypoint) -> np.ndarray:
+        """Boolean grid of the unvisited cells a walk at `pos` can still reach through unvisited 8-neighbours."""
+        free = ~self.grid
+        reach = np.zeros(self.grid.shape, dtype=bool)
+        cell = self._cell(pos)
+        if cell is not None:
+            reach[cell] = True
+        while True:
+            # Grow by one cell in every direction, the 3x3 dilation is separable
+            grown = reach.copy()
+            grown[1:] |= reach[:-1]
+            grown[:-1] |= reach[1:]
+            rows = grown.copy()
+            grown[:,1:] |= rows[:,:-1]
+            grown[:,:-1] |= rows[:,1:]
+            grown &= free
+            if cell is not None:
+                grown[cell] = True
+            if np.array_equal(grown, reach):
+                break
+            reach = grown
+        if cell is not None:
+            reach[cell] = not self.grid[cell]
+        return reach
+
+    def __contains__(self, pos: Waypoint) -> bool:
+        cell = self._cell(pos)
+        return cell is not None and self.grid[cell]
+
+    def __len__(self) -> int:
+        return len(self.path)
+
+    @property
+    def x(self):
+        return [f.x for f in self.path]
+    @property
+    def y(self):
+        return [f.y for f in self.path]
+
 class LHC_GW_CONV(BaseWPGenerator):
     def __init__(self,**kwargs):
         super().__init__(**kwargs)
@@ -53,59 +140,153 @@ class LHC_GW_CONV(BaseWPGenerator):
         return self.GW()
 
     def _inf(self) -> int:
+        # A walk never revisits a cell, so it ends on its own after at most every cell of the map
         i = -1
         while True:
-            if i>2500:
+            if self.settings.max_steps is not None and i>self.settings.max_steps:
                 break
             yield (i:=i+1)
 
     def GW(self) -> Waypoints:
-        l_iterator = range(5,self.settings.l_value)
+        l_range = range(5,self.settings.l_value)
+        results = {}
         t = time.time()
-        return_dict = {}
-        if self.threaded:
-            logger.debug("Starting GW w/ threading")
-            manager = multiprocessing.Manager()
-            return_dict = manager.dict()
-            jobs = []
-
-            for l in l_iterator:
-                p = multiprocessing.Process(target=self.LHC_CONV, args=(l,return_dict))
-                jobs.append(p)
-                p.start()
-        
-            for proc in jobs:
-                proc.join()
-
-            logger.debug(f"Finished GW w/ threading. Time taken: {time.time()-t:.2f}s")
+        with ExitStack() as stack:
+            pool, spec = None, None
+            if self.threaded:
+                workers = min(os.cpu_count(), len(l_range))
+                logger.debug(f"Starting GW w/ a pool of {workers} workers")
+                spec = stack.enter_context(SharedArray.create(self.prob_map.prob_map)).spec
+                pool = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+            else:
+                logger.debug("Starting GW w/o threading")
+
+            evaluate = lambda ls: self._evaluate([l for l in ls if l in l_range], results, pool, spec)
+            if self.settings.l_search is LSearchEnum.COARSE:
+                self._coarse_search(l_range, evaluate, results)
+            elif self.settings.l_search is LSearchEnum.GOLDEN:
+                self._golden_search(l_range, evaluate, results)
+            else:
+                evaluate(l_range)
+        logger.debug(f"Finished GW. Time taken: {time.time()-t:.2f}s")
+
+        best_l = self._best(results)
+        aborted = sum(steps is None for steps, _ in results.values())
+        logger.info(f"l={best_l} had {100*results[best_l][1]:.2f}% efficiency, {len(results)} values of l walked of which {aborted} were aborted")
+        return self.path(results[best_l][0])
+
+    def _best(self, results: dict):
+        """The l of the best fully walked result, ties go to the smallest l."""
+        walked = [l for l, (steps, _) in results.items() if steps is not None]
+        return max(walked, key=lambda l: (results[l][1], -l), default=None)
+
+    def _evaluate(self, ls: list, results: dict, pool: ProcessPoolExecutor, spec) -> None:
+        """Score every l of `ls` not in `results` yet, aborting the walks that can't beat the best one so far."""
+        ls = sorted(set(ls) - results.keys())
+        if pool is None:
+            for l in ls:
+                best = self._best(results)
+                results[l] = self.score(l, None if best is None else results[best][1])
         else:
-            logger.debug("Starting GW w/o threading")
-            for l in l_iterator:
-                return_dict[l] = self.LHC_CONV(l,return_dict)
-                
-            logger.debug(f"Finished GW w/o threading. Time taken: {time.time()-t:.2f}s")
-
-        best_l = None
-        best_wps = None
-        best_prob = -np.inf
-        for key in return_dict:
-            l = key
-            wps = return_dict[key]
+            best = self._best(results)
+            incumbent = None if best is None else results[best][1]
+            futures = {l: pool.submit(pooled_LHC_CONV, spec, (self.home_wp.x, self.home_wp.y), self.settings, l, incumbent) for l in ls}
+            for l, future in futures.items():
+                results[l] = future.result()
+
+    def _coarse_search(self, l_range: range, evaluate, results: dict) -> None:
+        # Every `l_step`-th l, then either side of the best one at half the step until the step is 1
+        step = max(int(self.settings.l_step), 1)
+        evaluate(list(l_range[::step])+[l_range[-1]])
+        while step > 1:
+            step = (step+1)//2
+            best = self._best(results)
+            evaluate([best-step, best+step])
+
+    def _golden_search(self, l_range: range, evaluate, results: dict) -> None:
+        # Golden section search over the integers, the score is only roughly unimodal in l so ties keep the lower end
+        a, b = l_range[0], l_range[-1]
+        while b-a > 2:
+            c, d = b-round((b-a)/GOLDEN_RATIO), a+round((b-a)/GOLDEN_RATIO)
+            evaluate([c, d])
+            if results[c][1] >= results[d][1]:
+                b = d
+            else:
+                a = c
+        evaluate(range(a, b+1))
+
+    def score(self, l: int, incumbent: float = None):
+        """Walk `l` and score the resulting path, returns the walk's steps and the score.
+
+        Given the `incumbent` best score, the walk is checked against `bound` every `abort_every` steps and
+        abandoned once it can't beat it. The steps are None then and the score is the bound that ruled it out.
+        """
+        every = self.settings.abort_every if incumbent is not None else None
+        steps = []
+        for step, cur, visited in self._walk(l):
+            steps.append(step)
+            if every and len(steps) % every == 0:
+                bound = self.bound(cur, visited)
+                if bound < incumbent:
+                    logger.debug(f"({l}) Aborted after {len(steps)} steps as it can't score more than {bound:.4f}", enqueue=True)
+                    return None, bound
+        steps = np.array(steps, dtype=np.int8).reshape(-1,2)
+        return steps, self.calc_prob(self.path(steps))
+
+    def bound(self, cur: Waypoint, visited: VisitedGrid) -> float:
+        """Upper bound of `calc_prob` for any walk from the home waypoint that has visited `visited` and is at `cur`.
+
+        The rest of the walk can at most visit every cell still reachable from `cur`, or the best
+        of them it has steps left for if `max_steps` is set. The bound is padded by the worst
+        rounding error of `calc_prob` summing in the map's precision.
+        """
+        values = self._cell_values()
+        ahead = np.clip(values[visited.reachable(cur)], 0, None)
+        if self.settings.max_steps is not None:
+            # `_inf` runs for max_steps+2 steps
+            left = max(self.settings.max_steps+2-len(visited), 0)
+            ahead = np.sort(ahead)[len(ahead)-min(left, len(ahead)):]
+
+        home = self.prob_map[self.home_wp]
+        behind = values[visited.grid]
+        slack = (len(behind)+len(ahead)+2)*np.finfo(self.prob_map.prob_map.dtype).eps*(np.sum(np.abs(behind))+np.sum(ahead)+2*abs(home))
+        return 2*home + np.sum(behind) + np.sum(ahead) + slack
+
+    def _cell_values(self) -> np.ndarray:
+        # `calc_prob`'s value of the waypoint in every cell of a `VisitedGrid`, see `path` for the half cell shift
+        shape = self.prob_map.shape
+        cols = np.floor(np.arange(shape[0]) + self.home_wp.x%1 + 0.5).astype(int)
+        rows = np.floor(np.arange(shape[1]) + self.home_wp.y%1 + 0.5).astype(int)
+        on_map = (cols[:,None] < shape[1]) & (rows[None,:] < shape[0])
+        values = np.full(shape, float(-np.iinfo(np.int16).max))
+        values[on_map] = self.prob_map.prob_map[np.minimum(rows, shape[0]-1)[None,:], np.minimum(cols, shape[1]-1)[:,None]][on_map]
+        return values
+
+    def path(self, steps: np.ndarray) -> Waypoints:
+        """Waypoints of a walk from its (n, 2) unit `steps` away from the home waypoint."""
+        # Accumulate in order so the coordinates match the ones the walk visited exactly
+        xy = np.cumsum(np.vstack(([[self.home_wp.x, self.home_wp.y]], np.reshape(steps, (-1,2)))), axis=0)[1:]
+        return Waypoints([self.home_wp]+[Waypoint(f+0.5, g+0.5) for f, g in xy.tolist()]+[self.home_wp]) # Bring the coord into the center of the square
+
+    def LHC_CONV(self,l=0, ret_dict: dict=None) -> Waypoints:
+        wps = self.path(self.walk(l))
+        if ret_dict is not None:
+            ret_dict[l] = wps
+        return wps
 
-            probability = self.calc_prob(wps)
-            if probability > best_prob:
-                best_prob = probability
-                best_wps = wps
-                best_l = l
+    def walk(self, l: int) -> np.ndarray:
+        """Hill climb over the map clipped by max/`l` from the home waypoint.
 
-        logger.info(f"l={l} had {100*best_prob:.2f}% efficiency")
-        return best_wps
+        Returns the walk as an (n, 2) int8 array of the unit steps between the visited cells.
+        """
+        return np.array([step for step, _, _ in self._walk(l)], dtype=np.int8).reshape(-1,2)
 
-    def LHC_CONV(self,l=0, ret_dict: dict={}) -> Waypoints:
+    def _walk(self, l: int):
+        # Yields every step of the walk with the position it leads to and the cells visited so far
         logger.debug(f"({l}) Starting LHC_CONV with l={l}")
         wps = []
         accumulator = 0
-        visited = Waypoints([])
+        visited = VisitedGrid(self.prob_map)
 
         cur = self.home_wp
         t = time.time()
@@ -115,66 +296,59 @@ class LHC_GW_CONV(BaseWPGenerator):
         conflicts = 0
         for i in self._inf():
             if self.animate: plt.cla()
-            neighbours = np.array(self.neighbours(cur, visited, temp_prob_map))
-            try:
-                best = None
-                while best is None:
-                    inds = np.where(neighbours[:,1]==np.max(neighbours[:,1]))[0]
-                    ind = inds[0] # default
-
-                    if len(inds) > 1 or np.max(neighbours[:,1]) < self.search_threshold: # More than 1 "best" probability was found
-                        ind = None
-                        convs = ConvolutionType.LARGE
-                        if np.max(neighbours[:,1]) <= self.search_threshold:
-                            convs = ConvolutionType.HYUGE 
-                       
-                        conv_probs = np.array([self.convolute(neighbours[f][0],visited,temp_prob_map,convs) for f in inds])
-
-                        conv = [f.value for f in conv_probs]
-                        conv_max = np.max(conv)
-                        inds2 = np.where(conv==conv_max)
-                        
-                        if self.animate:
-                            for f in conv_probs:
-                                self._ax.add_artist(plt.Rectangle(f.bounds[0], f.n, f.n,fill=False, color=(f.value==conv_max,0,f.value!=conv_max)))
-                                if f.value==conv_max:
-                                    self._ax.add_artist(plt.Arrow(cur.x, cur.y, 3*(f.pos.x-cur.x), 3*(f.pos.y-cur.y)))
-
-                        ind = inds2[0][0]
-                        conflicts += 1
-
-                    potential_best = neighbours[ind]
-
-                    validated = self.validate(potential_best[0], visited, temp_prob_map) 
-                    if validated or len(neighbours) == 1:
-                        best = potential_best
-                    else:
-                        neighbours = np.delete(neighbours,ind,0)
-                    
-                    if self.animate: 
-                       self._plot(cur, neighbours, potential_best[0], visited, temp_prob_map, l)
-            except IndexError as e:
+            positions, values, counts = self.candidates(cur, visited, temp_prob_map)
+            if len(values) == 0:
                 break
 
+            best = None
+            while best is None:
+                inds = np.where(values==np.max(values))[0]
+                ind = inds[0] # default
+
+                if len(inds) > 1 or np.max(values) < self.search_threshold: # More than 1 "best" probability was found
+                    ind = None
+                    convs = ConvolutionType.LARGE
+                    if np.max(values) <= self.search_threshold:
+                        convs = ConvolutionType.HYUGE 
+                   
+                    conv_probs = np.array([self.convolute(Waypoint(*positions[f].tolist()),visited,temp_prob_map,convs) for f in inds])
+
+                    conv = [f.value for f in conv_probs]
+                    conv_max = np.max(conv)
+                    inds2 = np.where(conv==conv_max)
+                    
+                    if self.animate:
+                        for f in conv_probs:
+                            self._ax.add_artist(plt.Rectangle(f.bounds[0], f.n, f.n,fill=False, color=(f.value==conv_max,0,f.value!=conv_max)))
+                            if f.value==conv_max:
+                                self._ax.add_artist(plt.Arrow(cur.x, cur.y, 3*(f.pos.x-cur.x), 3*(f.pos.y-cur.y)))
+
+                    ind = inds2[0][0]
+                    conflicts += 1
+
+                potential_best = (Waypoint(*positions[ind].tolist()), values[ind])
+
+                # A candidate is valid if it has an unvisited neighbour of its own
+                if counts[ind] > 0 or len(values) == 1:
+                    best = potential_best
+                else:
+                    positions, values, counts = np.delete(positions,ind,0), np.delete(values,ind), np.delete(counts,ind)
+                
+                if self.animate: 
+                   self._plot(cur, positions, potential_best[0], visited, temp_prob_map, l)
+
             accumulator += best[1]
             best = best[0]
             wps.append(best)
+            step = (round(best.x-cur.x), round(best.y-cur.y))
 
             cur = wps[-1]
             visited.add(best)
+            yield step, cur, visited
            
         logger.debug(f"({l}) Completed in {time.time()-t:.3f}s with local score {accumulator:.4f} and {conflicts} conflicts", enqueue=True)
-        
-
-        wps = Waypoints([self.home_wp]+[Waypoint(f.x+0.5, f.y+0.5) for f in wps]+[self.home_wp]) # Bring the coord into the center of the square
 
-        if self.threaded:
-            ret_dict[l] = wps
-        else: 
-            return wps
-
-    def convolute(self, pos: Waypoint, visited: Waypoints, prob_map: ProbabilityMap, conv_type: ConvolutionType):
-        kernel = None
+    def convolute(self, pos: Waypoint, visited: VisitedGrid, prob_map: ProbabilityMap, conv_type: ConvolutionType):
         n = 0
         if conv_type is ConvolutionType.SMALL:
             n = 3
@@ -187,34 +361,47 @@ class LHC_GW_CONV(BaseWPGenerator):
         else:
             raise TypeError(f"Unknown ConvolutionType: {type(conv_type)} with value {conv_type}")
         
-        kernel = np.ones((n,n))
-
-        sum_ = 0
         shift = int((n-1)/2)
 
-        c = 1
-        for i in range(n):
-            for j in range(n):
-                iprime, jprime =(i-shift, j-shift) 
+        # The unvisited cells of the box around pos, x outer and y inner and without the centre
+        d = np.arange(-shift, shift+1)
+        dx, dy = np.repeat(d, n), np.tile(d, n)
+        off_centre = (dx != 0) | (dy != 0)
+        xy = np.column_stack((pos.x+dx[off_centre], pos.y+dy[off_centre]))
+        if isinstance(visited, VisitedGrid):
+            xy = xy[~visited.contains(xy)]
+        else:
+            xy = xy[np.array([Waypoint(*f) not in visited for f in xy.tolist()], dtype=bool)]
 
-                if (iprime,jprime) == (0,0): continue
+        # Summed one after the other in that order like the original per cell loop, so ties between boxes break the same way
+        values = prob_map.lookup(xy)
+        sum_ = np.add.accumulate(values)[-1] if len(values) > 0 else 0
+        return ConvolutionResult(pos,sum_/float(1+len(values)),n)
 
-                eval_pos = Waypoint(pos.x+iprime,pos.y+jprime)
-                if eval_pos in visited: continue
+    def validate(self, pos: Waypoint, visited: VisitedGrid, prob_map: ProbabilityMap):
+        return len(self.neighbours(pos, visited, prob_map)) > 0 # True if 1 or more valid position exists
+    
+    def neighbours(self, pos: Waypoint, visited: VisitedGrid, prob_map: ProbabilityMap):
+        positions, values, _ = self.candidates(pos, visited, prob_map)
+        return [(Waypoint(*f), g) for f, g in zip(positions.tolist(), values)]
 
+    def _valid(self, xy: np.ndarray, visited: VisitedGrid, prob_map: ProbabilityMap) -> np.ndarray:
+        in_bounds = (np.min(xy, axis=-1) >= 0) & (xy[...,0] <= prob_map.shape[0]-0.5) & (xy[...,1] <= prob_map.shape[1]-0.5)
+        return in_bounds & ~visited.contains(xy)
 
-                prob = prob_map[eval_pos] * kernel[i,j] 
+    def candidates(self, pos: Waypoint, visited: VisitedGrid, prob_map: ProbabilityMap):
+        """Valid 8-neighbours of `pos` in `surrounding_grid` order as (k, 2) positions, their probabilities and the number of valid neighbours each of them has in turn."""
+        xy = np.array([pos.x, pos.y]) + NEIGHBOUR_OFFSETS
+        xy = xy[self._valid(xy, visited, prob_map)]
 
-                sum_ += prob
-                c += 1
-        return ConvolutionResult(pos,sum_/float(c),n)
+        # Cells past the map's edge read as `ProbabilityMap.__getitem__`'s out of range value
+        i, j = xy[:,1].astype(int), xy[:,0].astype(int)
+        on_map = (i < prob_map.shape[0]) & (j < prob_map.shape[1])
+        values = np.full(len(xy), -np.iinfo(np.int16).max, dtype=prob_map.prob_map.dtype)
+        values[on_map] = prob_map.prob_map[i[on_map], j[on_map]]
 
-    def validate(self, pos: Waypoint, visited: Waypoints, prob_map: ProbabilityMap):
-        return len(self.neighbours(pos, visited, prob_map)) > 0 # True if 1 or more valid position exists
-    
-    def neighbours(self, pos: Waypoint, visited: Waypoints, prob_map: ProbabilityMap):
-        neighbours = self.surrounding_grid(pos)
-        return [(f, prob_map[f]) for f in neighbours if min(f) >= 0 and f.x <= prob_map.shape[0]-0.5 and f.y <= prob_map.shape[1]-0.5 if f not in visited]
+        counts = np.sum(self._valid(xy[:,None] + NEIGHBOUR_OFFSETS, visited, prob_map), axis=1)
+        return xy, values, counts
 
     def calc_prob(self,wps: Waypoints) -> float:
         accumulator = 0
@@ -225,23 +412,13 @@ class LHC_GW_CONV(BaseWPGenerator):
         return accumulator
 
     def surrounding_grid(self, pos: Waypoint) -> list:
-        tmp = [
-            (-1, -1),
-            (1, -1),
-            ( 0,-1),
-            (-1,1),
-            (1,1),
-            ( 0, 1),
-            (-1, 0),
-            ( 1, 0),
-        ]
-        return [Waypoint(pos.x+f[0],pos.y+f[1]) for f in tmp]
+        return [Waypoint(pos.x+f[0],pos.y+f[1]) for f in NEIGHBOUR_OFFSETS.tolist()]
     
-    def _plot(self, cur:Waypoint, neighbours: Waypoints, best: Waypoint, visited: Waypoints, prob_map: ProbabilityMap, l_val:float) -> None:
+    def _plot(self, cur:Waypoint, neighbours: np.ndarray, best: Waypoint, visited: VisitedGrid, prob_map: ProbabilityMap, l_val:float) -> None:
         if len(visited) > 0:
             self._ax.plot(visited.x,visited.y, color='r')
         for i in neighbours:
-            self._ax.add_artist(plt.Circle(i[0], size, color='b'))
+            self._ax.add_artist(plt.Circle(i, size, color='b'))
         self._ax.add_artist(plt.Circle((cur.x,cur.y), size, color='r'))
         self._ax.add_artist(plt.Circle(best, size, color='g'))
         img = prob_map.toIMG()
@@ -252,6 +429,19 @@ class LHC_GW_CONV(BaseWPGenerator):
         plt.pause(0.001)
        
 
+def pooled_LHC_CONV(prob_spec, home: tuple, settings, l: int, incumbent: float = None):
+    """Walk and score one `l` of `LHC_GW_CONV.GW` in a pool worker against the shared base probability map.
+
+    Returns `LHC_GW_CONV.score`'s int8 steps and score so the result pickles cheaply.
+    """
+    with SharedArray.attach(prob_spec) as shared:
+        prob_map = ProbabilityMap(shared.array)
+        # The shared map is normalised already, renormalising could change its values
+        prob_map.prob_map = np.copy(shared.array)
+    gen = LHC_GW_CONV(prob_map=prob_map, home_wp=Waypoint(*home), animate=False, threaded=False)
+    gen.settings = settings
+    return gen.score(l, incumbent)
+
 def main():
     import matplotlib.pyplot as plt
     wps = LHC_GW_CONV(ProbabilityMap.fromPNG("waypoint_generation/probs_map_1.png"), Waypoint(0,0)).LHC()
@@ -261,4 +451,3 @@ def main():
     plt.show()
 
     print(wps)
-
@@ -1,4 +1,4 @@
-from .LHC_GW_CONV import LHC_GW_CONV, ConvolutionType
+from .LHC_GW_CONV import LHC_GW_CONV, ConvolutionType, VisitedGrid
 from .pabo import PABO, CostFunc
 from .modified_lawnmower import ModifiedLawnmower
 from .parallel_swaths import ParallelSwaths
@@ -3,14 +3,32 @@ from src.data_models.probability_map import ProbabilityMap
 from src.enums import *
 import enum
 import os
+import numpy as np
 from src.data_models.positional.waypoint import Waypoint, Waypoints
+from src.array_helper import unique_counts
 
 class SarGenOutput:
+    """Placed objects as the unique occupied cells and the number of objects in each."""
     def __init__(self) -> None:
-        self.data = [] 
+        self.cells = np.zeros((0,2))
+        self.counts = np.zeros(0,dtype=int)
+
+    @property
+    def data(self) -> list:
+        return [f for f in Waypoints(np.repeat(self.cells,self.counts,axis=0))]
+    @data.setter
+    def data(self, locations: list) -> None:
+        self.add_generated_locations(Waypoints(locations))
+
+    def __len__(self) -> int:
+        return int(np.sum(self.counts))
+
+    def add_generated_cells(self, cells: np.ndarray, counts: np.ndarray = None):
+        self.cells, self.counts = unique_counts(cells, counts)
+
     def add_generated_locations(self, *args):
         if isinstance(args[0] ,Waypoints):
-            self.data = [f for f in args[0]]
+            self.add_generated_cells(np.array(args[0].toNumpyArray(),dtype=float).reshape(-1,2))
         elif all([isinstance(f,Waypoint) for f in args]):
             self.add_generated_locations(Waypoints(args))
         else:
@@ -37,6 +55,8 @@ class WPSettingsDecoder(json.JSONDecoder):
             updates['pabo_solver'] = PABOSolverEnum[dct['pabo_solver'].upper()]                    
         if 'home_wp' in dct:
             updates['home_wp'] = Waypoint(dct['home_wp'])
+        if 'l_search' in dct:
+            updates['l_search'] = LSearchEnum[dct['l_search'].upper()]
         dct.update(updates)
         return dct
 
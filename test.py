@@ -1,8 +1,28 @@
 import unittest
+import os
+import tempfile
+import json
 import numpy as np
+os.environ.setdefault('OPP4SAR_DIR', os.path.dirname(os.path.realpath(__file__)))
 import src.waypoint_generation as wpg 
 import src.data_models.positional as pos
 import src.data_models.probability_map as pm
+import src.simulation.trajectory as traj
+import src.simulation.detection as det
+from src.simulation.spatial_index import GridIndex
+from src.simulation.vehicle import Vehicle, VehicleSimData
+import src.simulation.simulation as sim
+import src.simulation.monte_carlo as mc
+from src.simulation.lockstep import LockstepSimulation
+from src.simulation.cooperative import CooperativeSimulation
+from src.simulation.multi_radius import run_multi_radius
+from src.simulation.sharded import run_sharded
+from src.simulation.renderer import Renderer
+from src.simulation.success import probability_of_success
+from src.shared_memory_helper import SharedArray
+from src.waypoint_generation.waypoint_settings import SarGenOutput
+from src.json_helpers import GlobalJsonEncoder, GlobalJsonDecoder
+from src.enums import LSearchEnum
 
 class TestLHC_GW_CONV(unittest.TestCase):
     def test_conv_error_finding(self):
@@ -54,6 +74,519 @@ class TestProbabilityMap(unittest.TestCase):
 
         np.testing.assert_array_almost_equal(prob, img_placed, decimal=3)
 
-        
+    def test_lookup(self):
+        prob = pm.ProbabilityMap(np.random.rand(4,6))
+        xy = np.array([[0,0],[5.5,3.9],[-1.5,-2],[-6,-4],[-7,0],[6,0],[0,4],[2.25,-0.5],[-0.75,1]])
+        np.testing.assert_array_equal(prob.lookup(xy), [prob[tuple(f)] for f in xy])
 
-            
+class TestTrajectory(unittest.TestCase):
+    def test_sample(self):
+        trajectory = traj.Trajectory(pos.waypoint.Waypoint(1,2),pos.waypoint.Waypoint(5,-3),T=4,
+                                     start_vel=pos.pose.Pose(1,0),dest_vel=pos.pose.Pose(0,-1))
+        t = np.linspace(0,4,50)
+        p, v, a = trajectory.sample(t)
+
+        np.testing.assert_array_almost_equal(p, [list(trajectory.position(f)) for f in t])
+        np.testing.assert_array_almost_equal(v, [list(trajectory.velocity(f)) for f in t])
+        np.testing.assert_array_almost_equal(a, [list(trajectory.acceleration(f)) for f in t])
+
+    def test_sample_trajectories(self):
+        first = traj.Trajectory(pos.waypoint.Waypoint(0,0),pos.waypoint.Waypoint(5,5),T=3)
+        second = traj.Trajectory(pos.waypoint.Waypoint(5,5),pos.waypoint.Waypoint(0,8),T=2)
+        trajectories = traj.Trajectories([first,second])
+
+        p, _, _ = trajectories.sample([0,1.5,3.5,5])
+        np.testing.assert_array_almost_equal(p, [list(first.position(0)),list(first.position(1.5)),
+                                                 list(second.position(0.5)),list(second.position(2))])
+
+    def test_from_waypoints(self):
+        wps = pos.waypoint.Waypoints(np.array([[0,0],[4,1],[6,5],[2,7]]))
+        trajectories = traj.Trajectories.from_waypoints(wps, 2.0)
+        self.assertEqual(trajectories.coeff_array.shape, (3,2,6))
+
+        for trajectory in trajectories:
+            expected = traj.Trajectory(trajectory.start_pos, trajectory.dest_pos, T=trajectory.T,
+                                       start_vel=trajectory.start_vel, dest_vel=trajectory.dest_vel)
+            np.testing.assert_array_almost_equal(trajectory.coeff_array, expected.coeff_array)
+
+    def test_sample_times(self):
+        for T in (2.0, 0.7071067811865476, 9.300537618869138, 0.005):
+            t_local, expected = 0, []
+            while t_local <= T:
+                expected.append(t_local)
+                t_local += 0.01
+            self.assertEqual(traj.Trajectory(T=T).sample_times(0.01).tolist(), expected)
+        self.assertEqual(len(traj.Trajectory(T=2.0).sample_times(0.01)), 200)
+
+class TestDetection(unittest.TestCase):
+    def test_sampled_matches_brute_force(self):
+        points = np.random.randint(0,30,size=(500,2)).astype(float)
+        t = np.arange(200)*0.1
+        xy = np.column_stack((15+10*np.cos(t/3),15+10*np.sin(t/2)))
+        radius = 2.5
+
+        inds, t_found = det.first_detection_sampled(GridIndex(points,radius), t, xy, radius)
+
+        dist = np.linalg.norm(xy[:,None,:]-points[None,:,:],axis=2)
+        hits = dist < radius
+        expected_inds = np.where(np.any(hits,axis=0))[0]
+        expected_t = t[np.argmax(hits[:,expected_inds],axis=0)]
+
+        order = np.argsort(inds)
+        np.testing.assert_array_equal(inds[order], expected_inds)
+        np.testing.assert_array_equal(t_found[order], expected_t)
+
+
+    def test_swept_entry_time(self):
+        points = np.array([[5,0.5],[5,3],[0,0.5]])
+        t = np.array([0.0,1.0])
+        xy = np.array([[0.0,0.0],[10.0,0.0]])
+
+        inds, t_found = det.first_detection_swept(GridIndex(points,1), t, xy, 1.0)
+        self.assertEqual(sorted(inds.tolist()), [0,2])
+        self.assertAlmostEqual(t_found[inds.tolist().index(0)], (5-np.sqrt(0.75))/10)
+        self.assertEqual(t_found[inds.tolist().index(2)], 0)
+
+        inds, _ = det.first_detection_sampled(GridIndex(points,1), t, xy, 1.0)
+        self.assertEqual(inds.tolist(), [2])
+
+    def test_ledger(self):
+        candidates = np.array([[0,0],[1,0],[2,0]])
+        locations = np.array([[2,0],[0,0],[2,0],[5,5]])
+
+        for path in [None, os.path.join(tempfile.mkdtemp(),'ledger.npy')]:
+            ledger = det.DetectionLedger(len(candidates), path=path)
+            ledger.record(np.array([2]), np.array([1.0]))
+            ledger.record(np.array([0,2]), np.array([3.0,2.0]))
+
+            inds, t = ledger.detections(candidates, locations)
+            np.testing.assert_array_equal(inds, [0,2,1])
+            np.testing.assert_array_equal(t, [1.0,1.0,3.0])
+
+            ledger.close()
+            if path is not None:
+                self.assertFalse(os.path.exists(path))
+
+class TestVehicleSimData(unittest.TestCase):
+    def test_growth_and_views(self):
+        data = VehicleSimData(capacity=2)
+        for i in range(5):
+            data.update(i*0.5, pos.pose.Pose(i,2*i), pos.pose.Pose(1,2), pos.pose.Pose.zero())
+
+        self.assertEqual(len(data), 5)
+        np.testing.assert_array_equal(data.t, [0,0.5,1,1.5,2])
+        np.testing.assert_array_equal(data.pos.x, [0,1,2,3,4])
+        np.testing.assert_array_equal(data.pos.y, [0,2,4,6,8])
+        self.assertTrue(np.shares_memory(data.pos.x, data.pos.toNumpyArray()))
+
+    def test_bounded_window(self):
+        data = VehicleSimData(capacity=2, maxlen=3)
+        for i in range(50):
+            data.update(i*0.5, pos.pose.Pose(i,2*i), pos.pose.Pose(1,2), pos.pose.Pose.zero())
+        data.extend(np.arange(50,60)*0.5, np.zeros((10,2)), np.zeros((10,2)), np.zeros((10,2)))
+        data.extend([30.0], [[1,1]], [[0,0]], [[0,0]])
+
+        self.assertEqual(len(data), 3)
+        np.testing.assert_array_equal(data.t, [29,29.5,30])
+        self.assertLessEqual(len(data._t), 6)
+
+class TestVehicle(unittest.TestCase):
+    def test_integrate_matches_step(self):
+        t = np.arange(300)*0.01
+        des_acc = np.column_stack((np.sin(t),np.cos(2*t)))
+
+        scalar = Vehicle(pos=pos.pose.Pose(3,4))
+        for acc in des_acc:
+            scalar.step((0,0),(0,0),acc)
+        batched = Vehicle(pos=pos.pose.Pose(3,4))
+        batched.integrate(des_acc[:120])
+        batched.integrate(des_acc[120:])
+
+        self.assertAlmostEqual(scalar.pos.x, batched.pos.x)
+        self.assertAlmostEqual(scalar.dpos.y, batched.dpos.y)
+        np.testing.assert_array_almost_equal(scalar.data.t, batched.data.t)
+        np.testing.assert_array_almost_equal(scalar.data.pos.toNumpyArray(), batched.data.pos.toNumpyArray())
+        np.testing.assert_array_almost_equal(scalar.data.dpos.toNumpyArray(), batched.data.dpos.toNumpyArray())
+
+class TestMonteCarlo(unittest.TestCase):
+    def test_matches_individual_runs(self):
+        prob_map = pm.ProbabilityMap(np.random.randint(255,size=(20,20)))
+        wps = pos.waypoint.Waypoints(np.array([[1,1],[18,3],[15,17],[2,12]]))
+
+        result = mc.run_monte_carlo(sim.Simulation(wps,None,2,2.0), prob_map, 3, 200, seed=42)
+
+        rngs = [np.random.default_rng(f) for f in np.random.SeedSequence(42).spawn(3)]
+        for fraction, times, rng in zip(result.found_fraction, result.detection_times, rngs):
+            objs = pos.waypoint.Waypoints(prob_map.place_array(200, rng))
+            data = sim.Simulation(wps,objs,2,2.0).run()
+            self.assertAlmostEqual(fraction, len(data.found)/200.0)
+            np.testing.assert_array_almost_equal(times, sorted([f[0] for f in data.found]))
+
+class TestLockstep(unittest.TestCase):
+    def test_matches_individual_runs(self):
+        paths = [pos.waypoint.Waypoints(np.random.randint(0,30,size=(k,2)).astype(float)) for k in (6,2,9)]
+        objs = pos.waypoint.Waypoints(np.random.randint(0,30,size=(500,2)))
+
+        for detection in sim.DetectionModeEnum:
+            results = LockstepSimulation(paths,objs,2,2.0,detection=detection).run()
+            for wps, data in zip(paths, results):
+                expected = sim.Simulation(wps,objs,2,2.0,detection=detection).run()
+                np.testing.assert_array_equal(data.t, expected.t)
+                np.testing.assert_array_equal(data.pos.toNumpyArray(), expected.pos.toNumpyArray())
+                np.testing.assert_array_equal(data.ddpos.toNumpyArray(), expected.ddpos.toNumpyArray())
+                self.assertEqual([(f[0], list(f[1])) for f in data.found], [(f[0], list(f[1])) for f in expected.found])
+                self.assertEqual(data.stop_reason, expected.stop_reason)
+
+class TestWeightedObjects(unittest.TestCase):
+    def test_matches_duplicated_locations(self):
+        wps = pos.waypoint.Waypoints(np.array([[1,1],[18,3],[15,17],[2,12]]))
+        cells = np.random.randint(0,20,size=(100,2))
+        counts = np.random.randint(1,5,size=100)
+
+        weighted = sim.Simulation(wps,cells,2,2.0,object_counts=counts).run()
+        expanded = sim.Simulation(wps,pos.waypoint.Waypoints(np.repeat(cells,counts,axis=0)),2,2.0).run()
+        self.assertEqual(sorted((f[0], tuple(f[1])) for f in weighted.found), sorted((f[0], tuple(f[1])) for f in expanded.found))
+
+    def test_sar_gen_output_json(self):
+        sar = SarGenOutput()
+        sar.add_generated_locations(pos.waypoint.Waypoints(np.array([[1,2],[3,4],[1,2]])))
+        np.testing.assert_array_equal(sar.counts, [2,1])
+        self.assertEqual(len(sar), 3)
+
+        decoded = json.loads(json.dumps(sar,cls=GlobalJsonEncoder),cls=GlobalJsonDecoder)
+        np.testing.assert_array_equal(decoded.cells, sar.cells)
+        np.testing.assert_array_equal(decoded.counts, sar.counts)
+
+        legacy = json.loads(json.dumps({'__sar_gen_output__':True,'data':sar.data},cls=GlobalJsonEncoder),cls=GlobalJsonDecoder)
+        np.testing.assert_array_equal(legacy.counts, sar.counts)
+
+class TestTrajectoryCache(unittest.TestCase):
+    def test_replay_matches_flying(self):
+        wps = pos.waypoint.Waypoints(np.array([[1,1],[18,3],[15,17],[2,12]]))
+        with tempfile.TemporaryDirectory() as cache:
+            sim.Simulation(wps,np.random.randint(0,20,size=(50,2)),2,2.0,trajectory_cache=cache).run()
+            self.assertEqual(len(os.listdir(cache)), 1)
+
+            objs = np.random.randint(0,20,size=(200,2))
+            replayed = sim.Simulation(wps,objs,2,2.0,trajectory_cache=cache).run()
+            flown = sim.Simulation(wps,objs,2,2.0).run()
+
+        np.testing.assert_array_equal(replayed.t, flown.t)
+        np.testing.assert_array_equal(replayed.pos.toNumpyArray(), flown.pos.toNumpyArray())
+        self.assertEqual([(f[0], list(f[1])) for f in replayed.found], [(f[0], list(f[1])) for f in flown.found])
+
+class TestMultiRadius(unittest.TestCase):
+    def test_matches_individual_runs(self):
+        wps = pos.waypoint.Waypoints(np.array([[1,1],[18,3],[15,17],[2,12]]))
+        objs = np.random.randint(0,20,size=(300,2))
+        radii = [3,0.5,1.5]
+
+        for detection in sim.DetectionModeEnum:
+            result = run_multi_radius(sim.Simulation(wps,objs,1,2.0,detection=detection), radii)
+            np.testing.assert_array_equal(result.radii, sorted(radii))
+            for r, fraction, times in zip(result.radii, result.found_fraction, result.detection_times):
+                data = sim.Simulation(wps,objs,r,2.0,detection=detection).run()
+                self.assertAlmostEqual(fraction, len(data.found)/300.0)
+                np.testing.assert_array_almost_equal(times, sorted([f[0] for f in data.found]))
+
+            found_max = result.min_distance < max(radii)
+            self.assertEqual(np.sum(result.counts[found_max])/300.0, result.found_fraction[-1])
+
+class TestCoverageRaster(unittest.TestCase):
+    def test_lookup_matches_search(self):
+        wps = pos.waypoint.Waypoints(np.array([[1,1],[18,3],[15,17],[2,12]]))
+        objs = np.random.randint(0,20,size=(300,2))
+
+        for detection in sim.DetectionModeEnum:
+            raster = sim.Simulation(wps,objs,2,2.0,detection=detection,coverage_shape=(20,20)).run()
+            searched = sim.Simulation(wps,objs,2,2.0,detection=detection).run()
+            self.assertEqual(raster.coverage.shape, (20,20))
+            self.assertEqual([(f[0], list(f[1])) for f in raster.found], [(f[0], list(f[1])) for f in searched.found])
+
+            decoded = json.loads(json.dumps(raster,cls=GlobalJsonEncoder),cls=GlobalJsonDecoder)
+            np.testing.assert_array_equal(decoded.coverage, raster.coverage)
+
+    def test_off_grid(self):
+        raster = sim.CoverageRaster((5,10),1)
+        raster.times[2,7] = 3.0
+        np.testing.assert_array_equal(raster.lookup([[7,2],[2,7],[-1,0],[10,0]]), [3.0,np.nan,np.nan,np.nan])
+
+class TestSharedArray(unittest.TestCase):
+    def test_attach(self):
+        arr = np.random.rand(50,2)
+        with SharedArray.create(arr) as owner:
+            with SharedArray.attach(owner.spec) as shared:
+                np.testing.assert_array_equal(shared.array, arr)
+                shared.array[0] = -1
+            self.assertEqual(owner.array[0,0], -1)
+
+class TestStopConditions(unittest.TestCase):
+    def test_time_budget(self):
+        wps = pos.waypoint.Waypoints(np.array([[1,1],[18,3],[15,17],[2,12]]))
+        objs = np.random.randint(0,20,size=(300,2))
+        full = sim.Simulation(wps,objs,2,2.0).run()
+        self.assertEqual(full.stop_reason, sim.StopReasonEnum.COMPLETED)
+
+        data = sim.Simulation(wps,objs,2,2.0,max_time=10.0).run()
+        self.assertEqual(data.stop_reason, sim.StopReasonEnum.TIME_BUDGET)
+        np.testing.assert_array_equal(data.t, full.t[full.t <= 10.0])
+        self.assertEqual(sorted(f[0] for f in data.found), sorted(f[0] for f in full.found if f[0] <= 10.0))
+
+        decoded = json.loads(json.dumps(data,cls=GlobalJsonEncoder),cls=GlobalJsonDecoder)
+        self.assertEqual(decoded.stop_reason, sim.StopReasonEnum.TIME_BUDGET)
+
+    def test_found_fraction(self):
+        wps = pos.waypoint.Waypoints(np.array([[0,0],[20,0],[20,6],[0,6],[0,12],[20,12],[20,18],[0,18]]))
+        objs = np.random.randint(0,19,size=(100,2))
+        full = sim.Simulation(wps,objs,4,2.0).run()
+        self.assertEqual(len(full.found), 100)
+
+        data = sim.Simulation(wps,objs,4,2.0,target_found_fraction=1.0).run()
+        self.assertEqual(data.stop_reason, sim.StopReasonEnum.ALL_FOUND)
+        self.assertEqual(data.t[-1], full.t[full.t <= max(f[0] for f in full.found)][-1])
+
+        data = sim.Simulation(wps,objs,4,2.0,target_found_fraction=0.5).run()
+        self.assertEqual(data.stop_reason, sim.StopReasonEnum.FOUND_FRACTION)
+        self.assertGreaterEqual(len(data.found), 50)
+        self.assertLess(len(data.found), 100)
+
+    def test_found_fraction_coverage(self):
+        wps = pos.waypoint.Waypoints(np.array([[0,0],[20,0],[20,6],[0,6],[0,12],[20,12],[20,18],[0,18]]))
+        objs = np.random.randint(0,19,size=(100,2))
+        for detection in sim.DetectionModeEnum:
+            searched = sim.Simulation(wps,objs,4,2.0,detection=detection,target_found_fraction=0.5).run()
+            raster = sim.Simulation(wps,objs,4,2.0,detection=detection,target_found_fraction=0.5,coverage_shape=(20,20)).run()
+            self.assertEqual(raster.stop_reason, sim.StopReasonEnum.FOUND_FRACTION)
+            self.assertEqual(raster.stop_reason, searched.stop_reason)
+            np.testing.assert_array_equal(raster.t, searched.t)
+            self.assertEqual([(f[0], list(f[1])) for f in raster.found], [(f[0], list(f[1])) for f in searched.found])
+            self.assertEqual(np.nanmax(raster.coverage), max(f[0] for f in raster.found))
+
+class TestShardedDetection(unittest.TestCase):
+    def test_matches_run(self):
+        wps = pos.waypoint.Waypoints(np.array([[1,1],[18,3],[15,17],[2,12]]))
+        objs = np.random.randint(0,20,size=(500,2))
+
+        for detection in sim.DetectionModeEnum:
+            sharded = run_sharded(sim.Simulation(wps,objs,2,2.0,detection=detection),workers=3,min_cells_per_worker=1)
+            searched = sim.Simulation(wps,objs,2,2.0,detection=detection).run()
+            self.assertEqual([(f[0], list(f[1])) for f in sharded.found], [(f[0], list(f[1])) for f in searched.found])
+
+        sharded = run_sharded(sim.Simulation(wps,objs,2,2.0,target_found_fraction=0.3),workers=3,min_cells_per_worker=1)
+        searched = sim.Simulation(wps,objs,2,2.0,target_found_fraction=0.3).run()
+        self.assertEqual(sharded.stop_reason, searched.stop_reason)
+        np.testing.assert_array_equal(sharded.t, searched.t)
+        self.assertEqual([(f[0], list(f[1])) for f in sharded.found], [(f[0], list(f[1])) for f in searched.found])
+
+    def test_falls_back_in_process(self):
+        wps = pos.waypoint.Waypoints(np.array([[1,1],[18,3],[15,17],[2,12]]))
+        objs = np.random.randint(0,20,size=(500,2))
+        searched = sim.Simulation(wps,objs,2,2.0).run()
+        for workers, min_cells in ((1, 1), (3, 10**6)):
+            sharded = run_sharded(sim.Simulation(wps,objs,2,2.0),workers=workers,min_cells_per_worker=min_cells)
+            self.assertEqual(sharded.stop_reason, searched.stop_reason)
+            self.assertEqual([(f[0], list(f[1])) for f in sharded.found], [(f[0], list(f[1])) for f in searched.found])
+
+class TestEvents(unittest.TestCase):
+    def test_matches_run(self):
+        wps = pos.waypoint.Waypoints(np.array([[1,1],[18,3],[15,17],[2,12]]))
+        objs = np.random.randint(0,20,size=(300,2))
+        data = sim.Simulation(wps,objs,2,2.0).run()
+
+        events = list(sim.Simulation(wps,objs,2,2.0).iter_events(snapshot_every=5.0))
+        detections = [f for f in events if f.kind is sim.SimEventEnum.DETECTION]
+        snapshots = [f for f in events if f.kind is sim.SimEventEnum.SNAPSHOT]
+        self.assertIs(events[-1].kind, sim.SimEventEnum.STOP)
+        self.assertEqual(events[-1].stop_reason, sim.StopReasonEnum.COMPLETED)
+        self.assertEqual(sum(f.count for f in detections), len(data.found))
+        self.assertAlmostEqual(events[-1].found_fraction, len(data.found)/300.0)
+
+        self.assertEqual(sorted(f.t for f in detections for _ in range(f.count)), sorted(f[0] for f in data.found))
+        self.assertTrue(np.all(np.diff([f.t for f in events]) >= 0))
+        self.assertTrue(np.all(np.diff([f.t for f in snapshots]) >= 5.0))
+
+    def test_bounded_history(self):
+        rng = np.random.default_rng(5)
+        wps = pos.waypoint.Waypoints(rng.integers(0,40,size=(40,2)).astype(float))
+        objs = rng.integers(0,40,size=(300,2))
+        data = sim.Simulation(wps,objs,2,2.0).run()
+
+        simulation = sim.Simulation(wps,objs,2,2.0)
+        events = list(simulation.iter_events(history=4))
+        self.assertEqual(len(simulation.vehicle.data), 4)
+        self.assertLessEqual(len(simulation.vehicle.data._t), 64)
+        np.testing.assert_array_equal(simulation.vehicle.data.t, data.t[-4:])
+        self.assertEqual(sum(f.count for f in events if f.kind is sim.SimEventEnum.DETECTION), len(data.found))
+
+class TestRenderer(unittest.TestCase):
+    def test_ring_buffer(self):
+        renderer = Renderer(pos.waypoint.Waypoints(np.array([[1,1],[18,3]])), history=10)
+        t = np.arange(25, dtype=float)
+        renderer.push(t[:7], np.random.rand(7,2), np.random.rand(7,2), np.random.rand(7,2))
+        np.testing.assert_array_equal(renderer.samples()[:,0], t[:7])
+        renderer.push(t[7:], np.random.rand(18,2), np.random.rand(18,2), np.random.rand(18,2))
+        np.testing.assert_array_equal(renderer.samples()[:,0], t[-10:])
+        renderer.draw()
+
+class TestCooperative(unittest.TestCase):
+    def test_credits_first_detection(self):
+        paths = [pos.waypoint.Waypoints(np.array(f)) for f in ([[1,1],[18,3],[15,17]], [[18,18],[2,12],[10,1],[19,9]], [[10,10],[1,19]])]
+        objs = np.random.randint(0,20,size=(400,2))
+        data = CooperativeSimulation(paths,objs,2,2.0).run()
+        single = [sim.Simulation(wps,objs,2,2.0).run() for wps in paths]
+
+        first = {}
+        for d in single:
+            for t, xy in d.found:
+                first[tuple(xy)] = min(first.get(tuple(xy), np.inf), t)
+        credited = {}
+        for d, s in zip(data, single):
+            seen = {tuple(xy): t for t, xy in s.found}
+            for t, xy in d.found:
+                self.assertEqual(t, first[tuple(xy)])
+                self.assertEqual(t, seen[tuple(xy)])
+                credited[tuple(xy)] = credited.get(tuple(xy), 0)+1
+        cells, counts = np.unique(objs, axis=0, return_counts=True)
+        self.assertEqual(credited, {tuple(c): n for c, n in zip(cells.astype(float), counts) if tuple(c) in first})
+
+class TestSuccessCurve(unittest.TestCase):
+    def test_matches_cell_search(self):
+        wps = pos.waypoint.Waypoints(np.array([[1,1],[18,3],[15,17],[2,12]]))
+        prob_map = pm.ProbabilityMap(np.random.rand(20,25))
+        curve = probability_of_success(sim.Simulation(wps,None,2,2.0), prob_map)
+
+        x, y = np.meshgrid(np.arange(25), np.arange(20))
+        data = sim.Simulation(wps,np.column_stack((x.flatten(),y.flatten())),2,2.0).run()
+        t = np.array([f[0] for f in data.found])
+        mass = np.array([prob_map.prob_map[int(f[1][1]), int(f[1][0])] for f in data.found])
+        for ti in (0.0, 5.0, 12.5, np.inf):
+            self.assertAlmostEqual(curve.at(ti), np.sum(mass[t <= ti]))
+        self.assertTrue(np.all(np.diff(curve.p) > 0))
+
+        decoded = json.loads(json.dumps(curve,cls=GlobalJsonEncoder),cls=GlobalJsonDecoder)
+        np.testing.assert_array_equal(decoded.p, curve.p)
+
+class TestVisitedGrid(unittest.TestCase):
+    def test_membership(self):
+        visited = wpg.VisitedGrid(pm.ProbabilityMap(np.ones((10,12))))
+        visited.add(pos.waypoint.Waypoint(3.25,4.5))
+        self.assertIn(pos.waypoint.Waypoint(3.25,4.5), visited)
+        self.assertIn(pos.waypoint.Waypoint(3.25+1e-12,4.5-1e-12), visited)
+        self.assertNotIn(pos.waypoint.Waypoint(4.25,4.5), visited)
+        self.assertNotIn(pos.waypoint.Waypoint(-0.75,4.5), visited)
+        self.assertNotIn(pos.waypoint.Waypoint(3.25,40), visited)
+        self.assertEqual(visited.x, [3.25])
+
+    def test_add_off_grid(self):
+        visited = wpg.VisitedGrid(pm.ProbabilityMap(np.ones((4,4))))
+        for wp in (pos.waypoint.Waypoint(-1.5,2), pos.waypoint.Waypoint(2,4), pos.waypoint.Waypoint(7,-3)):
+            visited.add(wp)
+            self.assertNotIn(wp, visited)
+        self.assertFalse(np.any(visited.grid))
+        self.assertEqual(len(visited), 3)
+
+    def test_convolute_matches_loop(self):
+        def reference(wp, visited, prob_map, n):
+            # The original per cell loop of `convolute`
+            sum_, c, shift = 0, 1, (n-1)//2
+            for i in range(n):
+                for j in range(n):
+                    eval_pos = pos.waypoint.Waypoint(wp.x+i-shift,wp.y+j-shift)
+                    if (i,j) == (shift,shift) or eval_pos in visited: continue
+                    sum_ += prob_map[eval_pos]*1.0
+                    c += 1
+            return sum_/float(c)
+
+        # Ties between candidates are broken on these values, so they must be exactly those of the loop
+        for values in (np.random.rand(30,40), np.full((30,40),0.1), np.random.randint(0,3,size=(30,40))/7):
+            prob_map = pm.ProbabilityMap(values)
+            gen = wpg.LHC_GW_CONV(prob_map=prob_map,home_wp=pos.waypoint.Waypoint(0,0),animate=False)
+            visited = wpg.VisitedGrid(prob_map)
+            for x, y in np.random.randint(0,30,size=(300,2)):
+                visited.add(pos.waypoint.Waypoint(x+0.25,y+0.25))
+            path = pos.waypoint.Waypoints(visited.path)
+
+            for x, y in np.random.randint(-3,43,size=(60,2)):
+                wp = pos.waypoint.Waypoint(x+0.25,y+0.25)
+                for conv_type in wpg.ConvolutionType:
+                    result = gen.convolute(wp,visited,prob_map,conv_type)
+                    self.assertEqual(result.value, reference(wp,visited,prob_map,result.n))
+                    self.assertEqual(gen.convolute(wp,path,prob_map,conv_type).value, result.value)
+
+    def test_candidates(self):
+        prob_map = pm.ProbabilityMap(np.random.rand(20,20))
+        gen = wpg.LHC_GW_CONV(prob_map=prob_map,home_wp=pos.waypoint.Waypoint(0,0),animate=False)
+        visited = wpg.VisitedGrid(prob_map)
+        for x, y in np.random.randint(0,20,size=(150,2)):
+            visited.add(pos.waypoint.Waypoint(x,y))
+
+        def reference(wp):
+            return [(f, prob_map[f]) for f in gen.surrounding_grid(wp) if min(f) >= 0 and f.x <= 19.5 and f.y <= 19.5 and f not in visited]
+
+        for x, y in np.random.randint(0,20,size=(60,2)):
+            positions, values, counts = gen.candidates(pos.waypoint.Waypoint(x,y),visited,prob_map)
+            expected = reference(pos.waypoint.Waypoint(x,y))
+            self.assertEqual(positions.tolist(), [[f.x, f.y] for f, _ in expected])
+            self.assertEqual(values.tolist(), [g for _, g in expected])
+            self.assertEqual(counts.tolist(), [len(reference(f)) for f, _ in expected])
+
+    def test_walk(self):
+        prob_map = pm.ProbabilityMap(np.random.rand(15,15))
+        gen = wpg.LHC_GW_CONV(prob_map=prob_map,home_wp=pos.waypoint.Waypoint(0,0),animate=False,threaded=False)
+        cells = np.floor(gen.LHC_CONV(10).toNumpyArray()[1:-1]).astype(int)
+        self.assertEqual(len(np.unique(cells, axis=0)), len(cells))
+        self.assertTrue(np.all(cells >= 0) and np.all(cells < 15))
+        self.assertTrue(np.all(np.max(np.abs(np.diff(cells, axis=0)), axis=1) == 1))
+
+    def test_pooled_GW(self):
+        prob_map = pm.ProbabilityMap(np.random.rand(15,15))
+        home = pos.waypoint.Waypoint(2.5,3.5)
+        sequential = wpg.LHC_GW_CONV(prob_map=prob_map,home_wp=home,animate=False,threaded=False)
+        pooled = wpg.LHC_GW_CONV(prob_map=prob_map,home_wp=home,animate=False,threaded=True)
+        sequential.settings.l_value = pooled.settings.l_value = 9
+
+        steps, _ = sequential.score(7)
+        self.assertEqual(steps.dtype, np.int8)
+        np.testing.assert_array_equal(sequential.path(steps).toNumpyArray(), sequential.LHC_CONV(7).toNumpyArray())
+        np.testing.assert_array_equal(pooled.GW().toNumpyArray(), sequential.GW().toNumpyArray())
+
+    def test_reachable(self):
+        visited = wpg.VisitedGrid(pm.ProbabilityMap(np.ones((6,6))))
+        for y in range(6):
+            visited.add(pos.waypoint.Waypoint(2,y))
+        reachable = visited.reachable(pos.waypoint.Waypoint(0.5,0.5))
+        self.assertTrue(np.all(reachable[:2]) and not np.any(reachable[2:]))
+        reachable = visited.reachable(pos.waypoint.Waypoint(2,3))
+        self.assertTrue(np.all(reachable[[1,3]]) and not np.any(reachable[2]))
+
+    def test_bound(self):
+        prob_map = pm.ProbabilityMap(np.random.rand(15,15).astype(np.float32))
+        gen = wpg.LHC_GW_CONV(prob_map=prob_map,home_wp=pos.waypoint.Waypoint(2.5,3.25),animate=False,threaded=False)
+        for max_steps in (None, 40):
+            gen.settings.max_steps = max_steps
+            steps, score = gen.score(7)
+            for _, cur, visited in gen._walk(7):
+                self.assertGreaterEqual(gen.bound(cur, visited), score)
+
+            gen.settings.abort_every = 1
+            np.testing.assert_array_equal(gen.score(7, incumbent=score)[0], steps)
+            aborted, bound = gen.score(7, incumbent=10)
+            self.assertIsNone(aborted)
+            self.assertLess(bound, 10)
+
+    def test_l_search(self):
+        prob_map = pm.ProbabilityMap(np.random.rand(15,15))
+        gen = wpg.LHC_GW_CONV(prob_map=prob_map,home_wp=pos.waypoint.Waypoint(0,0),animate=False,threaded=False)
+        gen.settings.l_value = 20
+        gen.settings.max_steps = 60
+        gen.settings.l_search = LSearchEnum.EXHAUSTIVE
+        exhaustive = gen.GW().toNumpyArray()
+        gen.settings.abort_every = 4
+        np.testing.assert_array_equal(gen.GW().toNumpyArray(), exhaustive)
+
+        scores = {l: gen.score(l)[1] for l in range(5,20)}
+        for l_search in (LSearchEnum.COARSE, LSearchEnum.GOLDEN):
+            gen.settings.l_search = l_search
+            self.assertIn(gen.calc_prob(gen.GW()), scores.values())
+        gen.settings.l_search = LSearchEnum.COARSE
+        self.assertGreaterEqual(gen.calc_prob(gen.GW()), max(scores[l] for l in (5,13,19)))